@@ -1,8 +1,11 @@
 """Core CSV analyzer that orchestrates LLM and code execution."""
 
-import re
+import hashlib
+import random
 import time
-from dataclasses import dataclass
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import asdict, dataclass
 from pathlib import Path
 from typing import Generator
 
@@ -12,10 +15,28 @@ from config import Config
 from core.executor import CodeExecutor, ExecutionResult
 from core.prompts import PromptBuilder
 from core.error_handler import ErrorClassifier, format_error_context
-from llm import QwenLLM, OpenAILLM, DeepSeekLLM, BaseLLM
+from llm import BaseLLM, LLMBatcher
 
+# Shared pool for speculative LLM calls; losers finish in the background
+# instead of blocking the winning response
+_SPECULATIVE_POOL = ThreadPoolExecutor(max_workers=8)
 
-@dataclass
+# Shared micro-batcher: chat calls from concurrent sessions arriving
+# within the batch window are dispatched together
+_BATCHER = LLMBatcher()
+
+
+def _backoff_sleep(attempt: int):
+    """Back off with jitter to avoid synchronized retry storms."""
+    time.sleep(random.uniform(0, min(20, 2 ** attempt)))
+
+
+def _token(text: str) -> dict:
+    """Wrap a streamed progress/token string in the update envelope."""
+    return {"type": "token", "text": text}
+
+
+@dataclass(slots=True)
 class AnalysisResult:
     """Result of a complete analysis."""
     code: str
@@ -24,203 +45,447 @@ class AnalysisResult:
     explanation: str
     error: str | None = None
 
+    def as_stream_update(self) -> dict:
+        """Serialize as the terminal update of a streamed analysis."""
+        return {"type": "result", **asdict(self)}
+
 
 class CSVAnalyzer:
     """Main analyzer class that coordinates LLM and code execution."""
 
-    def __init__(self, csv_path: str, model: str = "qwen"):
+    # Maximum number of cached question -> result entries
+    _RESPONSE_CACHE_SIZE = 64
+
+    # Maximum number of cached code -> execution result entries
+    _EXEC_CACHE_SIZE = 32
+
+    # Code containing these tokens is never served from the execution cache
+    _SIDE_EFFECT_TOKENS = ("to_csv", "to_excel", "open(", "random", "input(")
+
+    def __init__(self, csv_path: str, model: str = "qwen", preview_only: bool = False):
         self.csv_path = csv_path
         self.model_name = model
+        self._preview_only = preview_only
+        self._dtype_map: dict | None = None
+        self._preview_cache: tuple[int, pd.DataFrame] | None = None
         self.llm = self._create_llm(model)
+        self._llm_small: BaseLLM | None = None
         self.executor = CodeExecutor(csv_path)
         self.history: list[dict] = []
         self._df: pd.DataFrame | None = None
-
-    def _create_llm(self, model: str) -> BaseLLM:
-        """Create LLM instance based on model name."""
-        llm_classes = {
-            "qwen": QwenLLM,
-            "openai": OpenAILLM,
-            "deepseek": DeepSeekLLM,
-        }
-        llm_class = llm_classes.get(model)
-        if llm_class is None:
-            raise ValueError(f"Unknown model: {model}. Choose from: {list(llm_classes.keys())}")
-        return llm_class()
+        self._csv_info: tuple[list[str], str, str] | None = None
+        self._columns_str: str | None = None
+        self._system_prompt: str | None = None
+        self._turn_messages: list[list[dict]] = []
+        self._csv_fingerprint: str | None = None
+        self._response_cache: OrderedDict[tuple[str, str], AnalysisResult] = OrderedDict()
+        self._pending_explanation_template: str | None = None
+        self._history_view: tuple[dict, ...] | None = None
+        self._exec_cache: OrderedDict[tuple[str, str], ExecutionResult] = OrderedDict()
+        # Figure produced by the most recent analysis, so the UI doesn't
+        # have to scan the output directory for it
+        self.last_figure_path: str | None = None
+
+    def _create_llm(self, model: str, llm_model: str | None = None) -> BaseLLM:
+        """Create LLM instance based on model name (SDK imported on demand)."""
+        if model == "qwen":
+            from llm import QwenLLM as llm_class
+        elif model == "openai":
+            from llm import OpenAILLM as llm_class
+        elif model == "deepseek":
+            from llm import DeepSeekLLM as llm_class
+        else:
+            raise ValueError(
+                f"Unknown model: {model}. Choose from: ['qwen', 'openai', 'deepseek']"
+            )
+        return llm_class(llm_model)
 
     def switch_model(self, model: str):
-        """Switch to a different LLM model."""
+        """Switch to a different LLM model (no-op when already selected)."""
+        if model == self.model_name:
+            return
         self.model_name = model
         self.llm = self._create_llm(model)
+        self._llm_small = None
+
+    def _get_small_llm(self) -> BaseLLM:
+        """Get (lazily) the small/cheap variant of the current provider."""
+        if self._llm_small is None:
+            small_model = Config.SMALL_MODELS.get(self.model_name)
+            self._llm_small = (
+                self._create_llm(self.model_name, small_model)
+                if small_model else self.llm
+            )
+        return self._llm_small
+
+    @staticmethod
+    def _is_simple_question(question: str) -> bool:
+        """Heuristic check whether a question is simple enough for the small model."""
+        question = question.strip()
+        if len(question) > Config.SIMPLE_QUESTION_MAX_CHARS:
+            return False
+        question_lower = question.lower()
+        return any(kw in question_lower for kw in Config.SIMPLE_QUESTION_KEYWORDS)
+
+    def _pick_llm(self, question: str) -> BaseLLM:
+        """Route simple questions to the smaller, lower-latency model."""
+        if self._is_simple_question(question):
+            return self._get_small_llm()
+        return self.llm
+
+    def _sample_dtypes(self) -> dict | None:
+        """Infer dtypes from a 1000-row sample so the full load skips inference."""
+        if self._dtype_map is None:
+            try:
+                sample = pd.read_csv(self.csv_path, nrows=1000, encoding='utf-8')
+                self._dtype_map = sample.dtypes.to_dict()
+            except Exception:
+                self._dtype_map = {}
+        return self._dtype_map or None
 
     def _load_df(self) -> pd.DataFrame:
         """Load and cache the DataFrame."""
         if self._df is None:
-            self._df = pd.read_csv(self.csv_path, encoding='utf-8')
+            dtype_map = self._sample_dtypes() if self._preview_only else None
+            try:
+                # The pyarrow engine parses in parallel and is much faster
+                # than the default C engine on wide/large files
+                df = pd.read_csv(
+                    self.csv_path, engine='pyarrow', encoding='utf-8', dtype=dtype_map
+                )
+            except (ImportError, ValueError, TypeError):
+                # Sampled dtypes may not hold for the whole file; fall back
+                # to a plain load with full type inference
+                df = pd.read_csv(self.csv_path, encoding='utf-8')
+
+            # Convert low-cardinality string columns to category to cut memory
+            if len(df) > 0:
+                for col in df.columns:
+                    if (pd.api.types.is_string_dtype(df[col])
+                            and df[col].nunique() / len(df) < 0.5):
+                        df[col] = df[col].astype('category')
+
+            self._df = df
+            # Generated code reads this as the preloaded `df` variable,
+            # skipping a CSV reparse on every execution
+            self.executor.set_dataframe(df)
         return self._df
 
     def get_preview(self, rows: int = 5) -> pd.DataFrame:
-        """Get a preview of the CSV data."""
-        return self._load_df().head(rows)
+        """Get a preview of the CSV data (cached per row count)."""
+        if self._preview_cache is not None and self._preview_cache[0] == rows:
+            return self._preview_cache[1]
+        if self._preview_only and self._df is None:
+            # Read only the preview rows; the full load is deferred until
+            # the first analyze() call needs it
+            preview = pd.read_csv(self.csv_path, nrows=rows, encoding='utf-8')
+        else:
+            preview = self._load_df().head(rows)
+        self._preview_cache = (rows, preview)
+        return preview
 
     def _get_csv_info(self) -> tuple[list[str], str, str]:
-        """Get CSV column info, dtypes, and sample data."""
-        df = self._load_df()
-        columns = df.columns.tolist()
-        dtypes = df.dtypes.to_string()
-        sample_data = df.head(3).to_string()
-        return columns, dtypes, sample_data
-
-    def _build_messages(self, question: str) -> list[dict]:
-        """Build messages list for LLM including history."""
-        columns, dtypes, sample_data = self._get_csv_info()
-
-        system_prompt = PromptBuilder.build_system_prompt(
-            csv_path=self.csv_path,
-            columns=columns,
-            dtypes=dtypes,
-            sample_data=sample_data,
+        """Get CSV column info, dtypes, and sample data (cached)."""
+        if self._csv_info is None:
+            df = self._load_df()
+            columns = df.columns.tolist()
+            dtypes = df.dtypes.to_string()
+            sample_data = df.head(3).to_string()
+            self._csv_info = (columns, dtypes, sample_data)
+            self._columns_str = ", ".join(columns)
+        return self._csv_info
+
+    def _get_system_prompt(self) -> str:
+        """Build the system prompt once and reuse it across turns."""
+        if self._system_prompt is None:
+            columns, dtypes, sample_data = self._get_csv_info()
+            self._system_prompt = PromptBuilder.build_system_prompt(
+                csv_path=self.csv_path,
+                columns=columns,
+                dtypes=dtypes,
+                sample_data=sample_data,
+            )
+        return self._system_prompt
+
+    def _get_csv_fingerprint(self) -> str:
+        """Fingerprint the CSV (first 1MB + mtime) for cache keys."""
+        if self._csv_fingerprint is None:
+            digest = hashlib.blake2b(digest_size=16)
+            with open(self.csv_path, "rb") as f:
+                digest.update(f.read(1 << 20))
+            digest.update(str(Path(self.csv_path).stat().st_mtime_ns).encode())
+            self._csv_fingerprint = digest.hexdigest()
+        return self._csv_fingerprint
+
+    def _cache_lookup(self, question: str) -> AnalysisResult | None:
+        """Look up a previously computed result for the same question."""
+        key = (self._get_csv_fingerprint(), question.strip().lower())
+        result = self._response_cache.get(key)
+        if result is not None:
+            self._response_cache.move_to_end(key)
+        return result
+
+    def _cache_store(self, question: str, result: AnalysisResult):
+        """Cache a successful analysis result for repeated questions."""
+        if result.error:
+            return
+        key = (self._get_csv_fingerprint(), question.strip().lower())
+        self._response_cache[key] = result
+        if len(self._response_cache) > self._RESPONSE_CACHE_SIZE:
+            self._response_cache.popitem(last=False)
+
+    def _exec_cache_lookup(self, code: str) -> ExecutionResult | None:
+        """Look up a cached execution result for identical code."""
+        key = (self._get_csv_fingerprint(), code.strip())
+        result = self._exec_cache.get(key)
+        if result is not None:
+            self._exec_cache.move_to_end(key)
+        return result
+
+    def _exec_cache_store(self, code: str, result: ExecutionResult):
+        """Cache a successful, side-effect-free execution result."""
+        if not result.success or any(tok in code for tok in self._SIDE_EFFECT_TOKENS):
+            return
+        key = (self._get_csv_fingerprint(), code.strip())
+        self._exec_cache[key] = result
+        if len(self._exec_cache) > self._EXEC_CACHE_SIZE:
+            self._exec_cache.popitem(last=False)
+
+    def _execute_cached(self, code: str) -> ExecutionResult:
+        """Execute code, serving repeated deterministic snippets from cache."""
+        cached = self._exec_cache_lookup(code)
+        if cached is not None:
+            return cached
+        result = self.executor.execute(code)
+        self._exec_cache_store(code, result)
+        return result
+
+    def _record_turn(self, question: str, result: AnalysisResult):
+        """Record a completed turn in history and the cached message list."""
+        self.last_figure_path = result.figure_path
+        result_text = self._truncate_result(
+            result.error if result.error else result.output
         )
+        self.history.append({
+            "question": question,
+            "code": result.code,
+            "result": result_text,
+            "explanation": result.explanation,
+            "figure_path": result.figure_path,
+        })
+        self._append_turn_messages(question, result.code, result_text)
+
+    @staticmethod
+    def _truncate_result(result: str) -> str:
+        """Truncate an execution result so it doesn't bloat later prompts."""
+        if len(result) > Config.HISTORY_RESULT_CHARS:
+            return result[:Config.HISTORY_RESULT_CHARS] + "\n...[truncated]"
+        return result
+
+    def _append_turn_messages(self, question: str, code: str, result: str):
+        """Append a completed turn to the cached per-turn message list."""
+        turn = [
+            {"role": "user", "content": question},
+            {"role": "assistant", "content": f"```python\n{code}\n```"},
+        ]
+        if result:
+            turn.append({"role": "user", "content": f"执行结果:\n{result}"})
+        self._turn_messages.append(turn)
+        # Only the most recent turns are ever sent; drop the rest eagerly
+        del self._turn_messages[:-Config.MAX_HISTORY_TURNS]
 
-        messages = [{"role": "system", "content": system_prompt}]
-
-        # Add conversation history
-        for item in self.history:
-            messages.append({"role": "user", "content": item["question"]})
-            messages.append({
-                "role": "assistant",
-                "content": f"```python\n{item['code']}\n```"
-            })
-            if item.get("result"):
-                messages.append({
-                    "role": "user",
-                    "content": f"执行结果:\n{item['result']}"
-                })
-
-        # Add current question
+    def _build_messages(self, question: str) -> list[dict]:
+        """Build messages list for LLM including recent history."""
+        # Turn messages are maintained incrementally and bounded to the last
+        # MAX_HISTORY_TURNS turns, so prompt size stays O(1) per question
+        messages = [{"role": "system", "content": self._get_system_prompt()}]
+        for turn in self._turn_messages:
+            messages.extend(turn)
         messages.append({"role": "user", "content": question})
-
         return messages
 
     def _extract_code(self, response: str) -> str:
         """Extract code from LLM response."""
-        # Try to find code in ```python ... ``` blocks
-        pattern = r"```python\s*(.*?)\s*```"
-        matches = re.findall(pattern, response, re.DOTALL)
-        if matches:
-            return matches[0].strip()
-
-        # Try to find code in ``` ... ``` blocks
-        pattern = r"```\s*(.*?)\s*```"
-        matches = re.findall(pattern, response, re.DOTALL)
-        if matches:
-            return matches[0].strip()
-
-        return response.strip()
+        # Fast path: plain-code responses have no fences at all
+        if "```" not in response:
+            return response.strip()
+
+        # Linear scan for code fences; prefer ```python over bare ```
+        start = response.find("```python")
+        if start != -1:
+            start += len("```python")
+        else:
+            start = response.find("```")
+            start += 3
+
+        end = response.find("```", start)
+        if end == -1:
+            return response[start:].strip()
+        return response[start:end].strip()
+
+    @staticmethod
+    def _chat_speculative(llm: BaseLLM, messages: list[dict]) -> str:
+        """Issue speculative parallel chat calls, returning the first to finish."""
+        n = max(1, Config.SPECULATIVE_N)
+        if n == 1:
+            return _BATCHER.chat(llm, messages)
+
+        futures = [_BATCHER.submit(llm, messages) for _ in range(n)]
+        last_error = None
+        for future in as_completed(futures):
+            try:
+                response = future.result()
+            except Exception as e:
+                last_error = e
+                continue
+            for other in futures:
+                other.cancel()
+            return response
+        raise last_error
 
     def _generate_and_execute(
         self,
         messages: list[dict],
         max_retries: int = 3,
-        yield_callback=None
-    ) -> tuple[str, ExecutionResult]:
+        yield_callback=None,
+        llm: BaseLLM | None = None
+    ) -> tuple[str, ExecutionResult, str]:
         """Generate code and execute with retry on failure."""
-        current_messages = messages.copy()
+        if llm is None:
+            llm = self.llm
+        # Append correction turns directly to the caller's list and rewind
+        # on exit instead of copying the whole prompt up front
+        original_len = len(messages)
+        current_messages = messages
         last_error = None
 
-        for attempt in range(max_retries):
-            try:
-                if yield_callback:
-                    yield_callback(f"🔄 正在生成代码 (尝试 {attempt + 1}/{max_retries})...")
-                
-                # Generate code with retry on connection errors
-                response = None
-                llm_retry_count = 3
-                for llm_attempt in range(llm_retry_count):
-                    try:
-                        response = self.llm.chat(current_messages)
-                        break
-                    except Exception as e:
-                        if yield_callback:
-                            yield_callback(f"⚠️ LLM调用失败 (尝试 {llm_attempt + 1}/{llm_retry_count}): {str(e)}")
-                        if llm_attempt < llm_retry_count - 1:
-                            time.sleep(2 ** llm_attempt)  # Exponential backoff
-                        else:
-                            raise
-                
-                if response is None:
-                    raise Exception("LLM调用失败，无法获取响应")
-                
-                code = self._extract_code(response)
-                
-                if yield_callback:
-                    yield_callback(f"✅ 代码生成成功\n```python\n{code}\n```")
-                    yield_callback("🔧 正在执行代码...")
-
-                # Execute code
-                result = self.executor.execute(code)
-
-                if result.success:
+        try:
+            for attempt in range(max_retries):
+                try:
+                    if yield_callback:
+                        yield_callback(f"🔄 正在生成代码 (尝试 {attempt + 1}/{max_retries})...")
+                    
+                    # Generate code with retry on connection errors
+                    response = None
+                    llm_retry_count = 3
+                    for llm_attempt in range(llm_retry_count):
+                        try:
+                            response = self._chat_speculative(llm, current_messages)
+                            break
+                        except Exception as e:
+                            if yield_callback:
+                                yield_callback(f"⚠️ LLM调用失败 (尝试 {llm_attempt + 1}/{llm_retry_count}): {str(e)}")
+                            if llm_attempt < llm_retry_count - 1:
+                                _backoff_sleep(llm_attempt)
+                            else:
+                                raise
+                    
+                    if response is None:
+                        raise Exception("LLM调用失败，无法获取响应")
+                    
+                    code = self._extract_code(response)
+                    
                     if yield_callback:
-                        yield_callback(f"✅ 代码执行成功\n执行结果:\n{result.output}")
-                    return code, result
+                        yield_callback(f"✅ 代码生成成功\n```python\n{code}\n```")
+                        yield_callback("🔧 正在执行代码...")
 
-                # Code execution failed
-                last_error = result.error
+                    # Execute code in the background while the explanation
+                    # template is pre-parsed from the response, overlapping the two
+                    exec_future = _SPECULATIVE_POOL.submit(self._execute_cached, code)
+                    self._pending_explanation_template = \
+                        self._extract_explanation_template(response)
+                    result = exec_future.result()
 
-                # Classify the error for better feedback
-                error_info = ErrorClassifier.classify(result.error)
-                error_hint = ErrorClassifier.get_hint(error_info)
+                    if result.success:
+                        if yield_callback:
+                            yield_callback(f"✅ 代码执行成功\n执行结果:\n{result.output}")
+                        return code, result, response
 
-                if yield_callback:
-                    yield_callback(f"❌ 代码执行失败 (尝试 {attempt + 1}/{max_retries})")
-                    yield_callback(f"错误类型: {error_info.error_type.value.upper()}")
-                    yield_callback(f"错误信息:\n{result.error}")
-                    yield_callback(f"修复建议:\n{error_hint}")
-                    yield_callback("🔧 正在请求大模型修正代码...")
+                    # Code execution failed
+                    last_error = result.error
 
-                # Prepare enhanced error correction message
-                columns, dtypes, _ = self._get_csv_info()
-                error_prompt = format_error_context(
-                    error_msg=result.error,
-                    code=code,
-                    columns=columns,
-                    dtypes=dtypes,
-                    conversation_history=self._get_recent_history()
-                )
-                current_messages.append({"role": "assistant", "content": response})
-                current_messages.append({"role": "user", "content": error_prompt})
+                    # Classify the error for better feedback
+                    error_info = ErrorClassifier.classify(result.error)
+                    error_hint = ErrorClassifier.get_hint(error_info)
 
-            except Exception as e:
-                # LLM call failed
-                last_error = f"LLM调用错误: {str(e)}"
-                if yield_callback:
-                    yield_callback(f"❌ {last_error}")
-                    if attempt < max_retries - 1:
-                        yield_callback(f"🔄 正在重试 (尝试 {attempt + 2}/{max_retries})...")
-                
-                # If it's a connection error and we have retries left, wait and retry
-                if attempt < max_retries - 1:
-                    time.sleep(2 ** attempt)  # Exponential backoff
-                    continue
-                else:
-                    # Last attempt failed, return error result
-                    return "", ExecutionResult(
-                        success=False,
-                        output="",
-                        error=last_error,
-                        figure_path=None
+                    if yield_callback:
+                        yield_callback(f"❌ 代码执行失败 (尝试 {attempt + 1}/{max_retries})")
+                        yield_callback(f"错误类型: {error_info.error_type.value.upper()}")
+                        yield_callback(f"错误信息:\n{result.error}")
+                        yield_callback(f"修复建议:\n{error_hint}")
+                        yield_callback("🔧 正在请求大模型修正代码...")
+
+                    # Prepare enhanced error correction message
+                    _, dtypes, _ = self._get_csv_info()
+                    error_prompt = format_error_context(
+                        error_msg=result.error,
+                        code=code,
+                        columns=self._columns_str,
+                        dtypes=dtypes,
+                        conversation_history=self._get_recent_history()
                     )
+                    current_messages.append({"role": "assistant", "content": response})
+                    current_messages.append({"role": "user", "content": error_prompt})
 
-        # All retries exhausted
-        if yield_callback:
-            yield_callback(f"❌ 所有重试均失败，最终错误: {last_error}")
-        return code if 'code' in locals() else "", result if 'result' in locals() else ExecutionResult(
-            success=False,
-            output="",
-            error=last_error or "未知错误",
-            figure_path=None
-        )
+                except Exception as e:
+                    # LLM call failed
+                    last_error = f"LLM调用错误: {str(e)}"
+                    if yield_callback:
+                        yield_callback(f"❌ {last_error}")
+                        if attempt < max_retries - 1:
+                            yield_callback(f"🔄 正在重试 (尝试 {attempt + 2}/{max_retries})...")
+                    
+                    # If it's a connection error and we have retries left, wait and retry
+                    if attempt < max_retries - 1:
+                        _backoff_sleep(attempt)
+                        continue
+                    else:
+                        # Last attempt failed, return error result
+                        return "", ExecutionResult(
+                            success=False,
+                            output="",
+                            error=last_error,
+                            figure_path=None
+                        ), ""
+
+            # All retries exhausted
+            if yield_callback:
+                yield_callback(f"❌ 所有重试均失败，最终错误: {last_error}")
+            return code if 'code' in locals() else "", result if 'result' in locals() else ExecutionResult(
+                success=False,
+                output="",
+                error=last_error or "未知错误",
+                figure_path=None
+            ), response if 'response' in locals() and response else ""
+        finally:
+            del messages[original_len:]
+
+    @staticmethod
+    def _extract_explanation_template(response: str) -> str | None:
+        """Extract the inline explanation template following the code block."""
+        end = response.rfind("```")
+        tail = response[end + 3:] if end != -1 else response
+        for marker in ("解释:", "解释："):
+            idx = tail.find(marker)
+            if idx != -1:
+                return tail[idx + len(marker):].strip() or None
+        return None
+
+    def _render_explanation(
+        self,
+        response: str | None,
+        question: str,
+        result: ExecutionResult,
+        yield_callback=None
+    ) -> str:
+        """Fill the inline explanation template, or fall back to a second LLM call."""
+        if result.success and response:
+            template = (self._pending_explanation_template
+                        or self._extract_explanation_template(response))
+            self._pending_explanation_template = None
+            if template:
+                return template.replace("{result}", result.output[:2000].strip())
+        return self._generate_explanation(question, result, yield_callback)
 
     def _generate_explanation(self, question: str, result: ExecutionResult, yield_callback=None) -> str:
         """Generate explanation for the execution result."""
@@ -284,48 +549,177 @@ class CSVAnalyzer:
         """
         if yield_callback:
             yield_callback(f"📋 收到问题: {question}")
+
+        # Serve repeated questions straight from the cache
+        cached = self._cache_lookup(question)
+        if cached is not None:
+            if yield_callback:
+                yield_callback("⚡ 命中缓存，直接返回已有结果")
+            self._record_turn(question, cached)
+            return cached
+
+        if yield_callback:
             yield_callback("🔍 正在构建提示词...")
-        
+
         # Build messages
         messages = self._build_messages(question)
 
         # Generate and execute code
-        code, exec_result = self._generate_and_execute(
+        code, exec_result, response = self._generate_and_execute(
             messages,
             max_retries=Config.MAX_RETRIES,
-            yield_callback=yield_callback
+            yield_callback=yield_callback,
+            llm=self._pick_llm(question)
         )
 
-        # Generate explanation
-        explanation = self._generate_explanation(question, exec_result, yield_callback)
+        # Generate explanation (filled from the inline template when present,
+        # avoiding a second LLM round trip)
+        explanation = self._render_explanation(response, question, exec_result, yield_callback)
 
         # Save to history
+        result_text = self._truncate_result(
+            exec_result.output if exec_result.success else exec_result.error
+        )
         self.history.append({
             "question": question,
             "code": code,
-            "result": exec_result.output if exec_result.success else exec_result.error,
+            "result": result_text,
             "explanation": explanation,
         })
+        self._append_turn_messages(question, code, result_text)
+        self.last_figure_path = exec_result.figure_path
 
-        return AnalysisResult(
+        result = AnalysisResult(
             code=code,
             output=exec_result.output,
             figure_path=exec_result.figure_path,
             explanation=explanation,
             error=exec_result.error if not exec_result.success else None,
         )
+        self._cache_store(question, result)
+        return result
     
-    def analyze_stream(self, question: str) -> Generator[str, None, None]:
+    @staticmethod
+    def _split_batch_response(response: str, expected: int) -> list[str] | None:
+        """Split a batched response into per-question sections, or None."""
+        marker = "### 问题"
+        starts = []
+        pos = response.find(marker)
+        while pos != -1:
+            starts.append(pos)
+            pos = response.find(marker, pos + len(marker))
+        if len(starts) != expected:
+            return None
+        return [
+            response[start:starts[idx + 1]] if idx + 1 < len(starts)
+            else response[start:]
+            for idx, start in enumerate(starts)
+        ]
+
+    def analyze_batch(self, questions: list[str]) -> list[AnalysisResult]:
+        """
+        Answer several questions with a single LLM call.
+
+        The questions share one prompt prefill (system prompt + CSV schema)
+        and are enumerated in one completion, so quick follow-ups don't pay
+        full prefill latency per question. Falls back to sequential
+        analyze() calls when the response cannot be split per question.
+
+        Args:
+            questions: The questions to answer, in display order.
+
+        Returns:
+            One AnalysisResult per question, in the same order.
+        """
+        questions = [q.strip() for q in questions if q.strip()]
+        if not questions:
+            return []
+        if len(questions) == 1:
+            return [self.analyze(questions[0])]
+
+        # Serve cached questions directly; only the misses go to the LLM
+        results: dict[int, AnalysisResult] = {}
+        misses = []
+        for i, question in enumerate(questions):
+            cached = self._cache_lookup(question)
+            if cached is not None:
+                self._record_turn(question, cached)
+                results[i] = cached
+            else:
+                misses.append(i)
+
+        sections = None
+        if misses:
+            batch_prompt = PromptBuilder.build_batch_questions_prompt(
+                [questions[i] for i in misses]
+            )
+            messages = [{"role": "system", "content": self._get_system_prompt()}]
+            for turn in self._turn_messages:
+                messages.extend(turn)
+            messages.append({"role": "user", "content": batch_prompt})
+
+            try:
+                response = self._chat_speculative(self.llm, messages)
+                sections = self._split_batch_response(response, len(misses))
+            except Exception:
+                sections = None
+
+        if misses and sections is None:
+            # Batch format not honored (or call failed): answer one by one
+            for i in misses:
+                results[i] = self.analyze(questions[i])
+        elif misses:
+            for i, section in zip(misses, sections):
+                question = questions[i]
+                code = self._extract_code(section)
+                exec_result = self._execute_cached(code)
+                template = self._extract_explanation_template(section)
+                if exec_result.success and template:
+                    explanation = template.replace(
+                        "{result}", exec_result.output[:2000].strip()
+                    )
+                else:
+                    explanation = self._generate_explanation(question, exec_result)
+                result = AnalysisResult(
+                    code=code,
+                    output=exec_result.output,
+                    figure_path=exec_result.figure_path,
+                    explanation=explanation,
+                    error=exec_result.error if not exec_result.success else None,
+                )
+                self._record_turn(question, result)
+                self._cache_store(question, result)
+                results[i] = result
+
+        return [results[i] for i in range(len(questions))]
+
+    def analyze_stream(self, question: str) -> Generator[dict, None, None]:
         """
         Perform analysis with streaming updates.
-        
-        Yields progress messages. Use analyze() to get the final result.
+
+        Yields tagged dict updates: {"type": "token", "text": ...} while
+        generating, then one terminal {"type": "result", ...} carrying the
+        structured AnalysisResult fields.
         """
-        yield f"📋 收到问题: {question}\n"
-        yield "🔍 正在构建提示词...\n"
-        
+        yield _token(f"📋 收到问题: {question}\n")
+
+        # Serve repeated questions straight from the cache
+        cached = self._cache_lookup(question)
+        if cached is not None:
+            yield _token("⚡ 命中缓存，直接返回已有结果\n")
+            yield _token(f"```python\n{cached.code}\n```\n")
+            if cached.output:
+                yield _token(f"执行结果:\n{cached.output}\n")
+            yield _token(f"✅ 分析完成\n**分析:**\n{cached.explanation}\n")
+            self._record_turn(question, cached)
+            yield cached.as_stream_update()
+            return
+
+        yield _token("🔍 正在构建提示词...\n")
+
         messages = self._build_messages(question)
-        
+        llm = self._pick_llm(question)
+
         # Generate and execute with streaming
         code = ""
         exec_result = None
@@ -333,33 +727,79 @@ class CSVAnalyzer:
         
         for attempt in range(Config.MAX_RETRIES):
             try:
-                yield f"🔄 正在生成代码 (尝试 {attempt + 1}/{Config.MAX_RETRIES})...\n"
-                
-                # Generate code with retry on connection errors
+                yield _token(f"🔄 正在生成代码 (尝试 {attempt + 1}/{Config.MAX_RETRIES})...\n")
+
+                # Generate code with retry on connection errors,
+                # streaming tokens to the caller as they arrive
                 response = None
                 llm_retry_count = 3
                 for llm_attempt in range(llm_retry_count):
                     try:
-                        response = self.llm.chat(messages)
+                        chunks = []
+                        # Once the closing code fence streams past, start
+                        # compiling in the background while the explanation
+                        # tokens are still arriving
+                        fence_count = 0
+                        fence_tail = ""
+                        code_warmed = False
+                        for delta in llm.chat_stream(messages):
+                            chunks.append(delta)
+                            yield _token(delta)
+                            if not code_warmed:
+                                # Scan with an explicit position so a fence
+                                # split across deltas is never counted twice
+                                # through the carried tail
+                                buf = fence_tail + delta
+                                idx = 0
+                                while True:
+                                    pos = buf.find("```", idx)
+                                    if pos == -1:
+                                        break
+                                    fence_count += 1
+                                    idx = pos + 3
+                                fence_tail = buf[max(idx, len(buf) - 2):]
+                                if fence_count >= 2:
+                                    # Warm with the extracted source — the
+                                    # exact string execute() later compiles —
+                                    # so the cache entry actually hits
+                                    _SPECULATIVE_POOL.submit(
+                                        self.executor.precompile,
+                                        self._extract_code("".join(chunks)),
+                                    )
+                                    code_warmed = True
+                        yield _token("\n")
+                        response = "".join(chunks)
                         break
                     except Exception as e:
-                        yield f"⚠️ LLM调用失败 (尝试 {llm_attempt + 1}/{llm_retry_count}): {str(e)}\n"
+                        yield _token(f"⚠️ LLM调用失败 (尝试 {llm_attempt + 1}/{llm_retry_count}): {str(e)}\n")
                         if llm_attempt < llm_retry_count - 1:
-                            time.sleep(2 ** llm_attempt)
+                            _backoff_sleep(llm_attempt)
                         else:
                             raise
-                
+
                 if response is None:
                     raise Exception("LLM调用失败，无法获取响应")
-                
+
                 code = self._extract_code(response)
-                yield f"✅ 代码生成成功\n```python\n{code}\n```\n"
-                yield "🔧 正在执行代码...\n"
-                
-                exec_result = self.executor.execute(code)
-                
+                yield _token("✅ 代码生成成功\n")
+                yield _token("🔧 正在执行代码...\n")
+
+                # Identical deterministic code is served from the cache
+                exec_result = self._exec_cache_lookup(code)
+                if exec_result is None:
+                    # Stream partial output lines while the code runs
+                    exec_gen = self.executor.execute_stream(code)
+                    while True:
+                        try:
+                            line = next(exec_gen)
+                        except StopIteration as stop:
+                            exec_result = stop.value
+                            break
+                        yield _token(f"🖨️ {line}")
+                    self._exec_cache_store(code, exec_result)
+
                 if exec_result.success:
-                    yield f"✅ 代码执行成功\n执行结果:\n{exec_result.output}\n"
+                    yield _token("✅ 代码执行成功\n")
                     break
                 
                 last_error = exec_result.error
@@ -368,18 +808,18 @@ class CSVAnalyzer:
                 error_info = ErrorClassifier.classify(exec_result.error)
                 error_hint = ErrorClassifier.get_hint(error_info)
 
-                yield f"❌ 代码执行失败 (尝试 {attempt + 1}/{Config.MAX_RETRIES})\n"
-                yield f"错误类型: {error_info.error_type.value.upper()}\n"
-                yield f"错误信息:\n{exec_result.error}\n"
-                yield f"修复建议:\n{error_hint}\n"
-                yield "🔧 正在请求大模型修正代码...\n"
+                yield _token(f"❌ 代码执行失败 (尝试 {attempt + 1}/{Config.MAX_RETRIES})\n")
+                yield _token(f"错误类型: {error_info.error_type.value.upper()}\n")
+                yield _token(f"错误信息:\n{exec_result.error}\n")
+                yield _token(f"修复建议:\n{error_hint}\n")
+                yield _token("🔧 正在请求大模型修正代码...\n")
 
                 # Prepare enhanced error correction message
-                columns, dtypes, _ = self._get_csv_info()
+                _, dtypes, _ = self._get_csv_info()
                 error_prompt = format_error_context(
                     error_msg=exec_result.error,
                     code=code,
-                    columns=columns,
+                    columns=self._columns_str,
                     dtypes=dtypes,
                     conversation_history=self._get_recent_history()
                 )
@@ -388,10 +828,10 @@ class CSVAnalyzer:
                 
             except Exception as e:
                 last_error = f"LLM调用错误: {str(e)}"
-                yield f"❌ {last_error}\n"
+                yield _token(f"❌ {last_error}\n")
                 if attempt < Config.MAX_RETRIES - 1:
-                    yield f"🔄 正在重试 (尝试 {attempt + 2}/{Config.MAX_RETRIES})...\n"
-                    time.sleep(2 ** attempt)
+                    yield _token(f"🔄 正在重试 (尝试 {attempt + 2}/{Config.MAX_RETRIES})...\n")
+                    _backoff_sleep(attempt)
                 else:
                     exec_result = ExecutionResult(
                         success=False,
@@ -408,38 +848,50 @@ class CSVAnalyzer:
                 error=last_error or "未知错误：所有尝试均失败",
                 figure_path=None
             )
-            yield f"❌ 所有重试均失败，最终错误: {exec_result.error}\n"
+            yield _token(f"❌ 所有重试均失败，最终错误: {exec_result.error}\n")
         elif not exec_result.success:
-            yield f"❌ 所有重试均失败，最终错误: {last_error or exec_result.error}\n"
-        
+            yield _token(f"❌ 所有重试均失败，最终错误: {last_error or exec_result.error}\n")
+
         if exec_result:
-            yield "📝 正在生成分析解释...\n"
+            yield _token("📝 正在生成分析解释...\n")
+            result_text = self._truncate_result(
+                exec_result.output if exec_result.success else exec_result.error
+            )
             try:
-                explanation = self._generate_explanation(question, exec_result)
-                yield f"✅ 分析完成\n**分析:**\n{explanation}\n"
-                
-                # Save to history with figure_path
-                self.history.append({
-                    "question": question,
-                    "code": code,
-                    "result": exec_result.output if exec_result.success else exec_result.error,
-                    "explanation": explanation,
-                    "figure_path": exec_result.figure_path,
-                })
+                explanation = self._render_explanation(response, question, exec_result)
+                yield _token(f"✅ 分析完成\n**分析:**\n{explanation}\n")
             except Exception as e:
-                yield f"⚠️ 生成解释时出错: {str(e)}\n"
+                yield _token(f"⚠️ 生成解释时出错: {str(e)}\n")
                 # Still save to history even if explanation failed
-                self.history.append({
-                    "question": question,
-                    "code": code,
-                    "result": exec_result.output if exec_result.success else exec_result.error,
-                    "explanation": f"生成解释时出错: {str(e)}",
-                    "figure_path": exec_result.figure_path,
-                })
+                explanation = f"生成解释时出错: {str(e)}"
+
+            # Save to history with figure_path
+            self.history.append({
+                "question": question,
+                "code": code,
+                "result": result_text,
+                "explanation": explanation,
+                "figure_path": exec_result.figure_path,
+            })
+            self._append_turn_messages(question, code, result_text)
+            self.last_figure_path = exec_result.figure_path
+            result = AnalysisResult(
+                code=code,
+                output=exec_result.output,
+                figure_path=exec_result.figure_path,
+                explanation=explanation,
+                error=exec_result.error if not exec_result.success else None,
+            )
+            self._cache_store(question, result)
+            yield result.as_stream_update()
 
     def new_conversation(self):
         """Start a new conversation (clear history)."""
         self.history = []
+        self._turn_messages = []
+        # Drop the cached view: the length check alone can't tell a new
+        # conversation from the old one once they reach equal length
+        self._history_view = None
         self.executor.reset()
 
     def set_test_mode(self, enabled: bool, fail_count: int = 1):
@@ -452,6 +904,13 @@ class CSVAnalyzer:
         """
         self.executor.set_test_mode(enabled, fail_count)
 
-    def get_history(self) -> list[dict]:
-        """Get conversation history."""
-        return self.history.copy()
+    @property
+    def history_view(self) -> tuple[dict, ...]:
+        """Read-only view of conversation history, cached between turns."""
+        if self._history_view is None or len(self._history_view) != len(self.history):
+            self._history_view = tuple(self.history)
+        return self._history_view
+
+    def get_history(self) -> tuple[dict, ...]:
+        """Get a read-only view of conversation history."""
+        return self.history_view
@@ -1,6 +1,9 @@
 """Gradio Web application for CSV Data Analyzer."""
 
+import asyncio
+import functools
 import json
+import os
 from datetime import datetime
 from pathlib import Path
 
@@ -9,24 +12,74 @@ import pandas as pd
 
 from analyzer import CSVAnalyzer, AnalysisResult
 
-# Global analyzer instance
-analyzer: CSVAnalyzer | None = None
+# orjson serializes compact JSON several times faster than stdlib json;
+# fall back transparently when it isn't installed
+try:
+    import orjson
 
-# History save directory
+    def _dumps_line(record: dict) -> bytes:
+        return orjson.dumps(record, option=orjson.OPT_APPEND_NEWLINE)
+
+    _loads = orjson.loads
+except ImportError:
+    orjson = None
+
+    def _dumps_line(record: dict) -> bytes:
+        return (json.dumps(record, ensure_ascii=False) + "\n").encode("utf-8")
+
+    _loads = json.loads
+
+# Per-session analyzer instances, keyed on the Gradio session hash so
+# concurrent users don't overwrite each other's state
+_analyzers: dict[str, CSVAnalyzer] = {}
+
+
+def _session_key(request: gr.Request | None) -> str:
+    """Derive the analyzer key for a request (tests may pass None)."""
+    if request is not None and getattr(request, "session_hash", None):
+        return request.session_hash
+    return "default"
+
+
+def _get_analyzer(request: gr.Request | None) -> CSVAnalyzer | None:
+    """Get the analyzer bound to this session, if a CSV has been loaded."""
+    return _analyzers.get(_session_key(request))
+
+# History save directory, created lazily on first save
 HISTORY_DIR = Path("history")
-HISTORY_DIR.mkdir(exist_ok=True)
 
 
-def load_csv(file) -> tuple[pd.DataFrame | None, str]:
-    """Load CSV file and return preview."""
-    global analyzer
+@functools.cache
+def _ensure_history_dir() -> Path:
+    """Create the history directory once, on first use."""
+    HISTORY_DIR.mkdir(exist_ok=True)
+    return HISTORY_DIR
+
+
+# Fingerprint of the CSV each session last loaded, so re-uploading the
+# same file doesn't rebuild the analyzer and reparse the data
+_last_csv_keys: dict[str, tuple] = {}
 
+
+def load_csv(file, request: gr.Request = None) -> tuple[pd.DataFrame | None, str]:
+    """Load CSV file and return preview."""
     if file is None:
         return None, "请上传 CSV"
 
     try:
         file_path = file.name if hasattr(file, 'name') else str(file)
-        analyzer = CSVAnalyzer(file_path, model="qwen")
+        session = _session_key(request)
+
+        # Cheap fingerprint: path + size + mtime, no content hash needed
+        stat = os.stat(file_path)
+        csv_key = (file_path, stat.st_size, int(stat.st_mtime))
+        existing = _analyzers.get(session)
+        if existing is not None and _last_csv_keys.get(session) == csv_key:
+            return existing.get_preview(rows=3), f"已加载: {Path(file_path).name}"
+
+        analyzer = CSVAnalyzer(file_path, model="qwen", preview_only=True)
+        _analyzers[session] = analyzer
+        _last_csv_keys[session] = csv_key
         preview = analyzer.get_preview(rows=3)
         return preview, f"已加载: {Path(file_path).name}"
 
@@ -34,10 +87,9 @@ def load_csv(file) -> tuple[pd.DataFrame | None, str]:
         return None, f"失败: {str(e)}"
 
 
-def switch_model(model: str) -> str:
+def switch_model(model: str, request: gr.Request = None) -> str:
     """Switch the LLM model."""
-    global analyzer
-
+    analyzer = _get_analyzer(request)
     if analyzer is None:
         return "请先上传 CSV"
 
@@ -66,13 +118,19 @@ def format_response(result: AnalysisResult) -> str:
     return "\n".join(parts)
 
 
-def analyze(
+# Sentinel marking the end of a streamed analysis
+_STREAM_DONE = object()
+
+
+async def analyze(
     question: str,
     history: list,
-    model: str
+    model: str,
+    batch_mode: bool = False,
+    request: gr.Request = None
 ):
     """Process user question and return response with streaming updates."""
-    global analyzer
+    analyzer = _get_analyzer(request)
 
     if not question.strip():
         yield history, None, ""
@@ -86,70 +144,114 @@ def analyze(
         yield history, None, ""
         return
 
-    if model != analyzer.model_name:
+    # switch_model is a no-op when the model is unchanged, so just call it
+    try:
+        analyzer.switch_model(model)
+    except Exception as e:
+        history = history + [
+            {"role": "user", "content": question},
+            {"role": "assistant", "content": f"切换模型失败: {str(e)}"}
+        ]
+        yield history, None, ""
+        return
+
+    # In batch mode (explicit opt-in) each non-empty line is its own
+    # question and all of them share one LLM call's prompt prefill;
+    # otherwise a multi-line submission stays a single question
+    questions = (
+        [line.strip() for line in question.splitlines() if line.strip()]
+        if batch_mode else []
+    )
+    if len(questions) > 1:
+        current_history = history + [{"role": "user", "content": question}]
+        yield current_history + [
+            {"role": "assistant", "content": "⏳ 正在批量分析多个问题..."}
+        ], None, ""
         try:
-            analyzer.switch_model(model)
+            results = await asyncio.to_thread(analyzer.analyze_batch, questions)
+            figure_path = None
+            parts = []
+            for q, result in zip(questions, results):
+                figure_path = result.figure_path or figure_path
+                parts.append(f"### {q}\n{format_response(result)}")
+            yield current_history + [
+                {"role": "assistant", "content": "\n\n".join(parts)}
+            ], figure_path, ""
         except Exception as e:
-            history = history + [
-                {"role": "user", "content": question},
-                {"role": "assistant", "content": f"切换模型失败: {str(e)}"}
-            ]
-            yield history, None, ""
-            return
+            yield current_history + [
+                {"role": "assistant", "content": f"分析失败: {str(e)}"}
+            ], None, ""
+        return
 
     # Add user question to history immediately
     current_history = history + [{"role": "user", "content": question}]
     assistant_response = ""
     
     try:
-        # Use streaming analysis
-        for update in analyzer.analyze_stream(question):
-            assistant_response += update
-            # Update history with streaming response
-            current_history_with_response = current_history + [
-                {"role": "assistant", "content": assistant_response}
-            ]
-            yield current_history_with_response, None, ""
-        
-        # After streaming is complete, get the final formatted result
-        # The analyze_stream already saved to history, so we can get the result
-        # by calling analyze() which will use cached results, or we format from history
-        # Actually, let's just call analyze() to get the properly formatted result
-        # But this might duplicate LLM calls. Let's check if we can avoid that.
-        
-        # Get the last history item to format final response
-        if analyzer.history and analyzer.history[-1]["question"] == question:
-            last_item = analyzer.history[-1]
-            
-            # Get figure_path from history if available, otherwise try to find latest
-            figure_path = last_item.get("figure_path")
-            if not figure_path:
-                import glob
-                figures = sorted(glob.glob("outputs/figure_*.png"), key=lambda x: Path(x).stat().st_mtime, reverse=True)
-                figure_path = figures[0] if figures else None
-            
-            # Determine if there was an error
-            result_text = last_item.get("result", "")
-            has_error = result_text and ("错误" in result_text or "失败" in result_text or "Error" in result_text)
-            
-            final_result = AnalysisResult(
-                code=last_item.get("code", ""),
-                output=result_text if not has_error else "",
-                figure_path=figure_path,
-                explanation=last_item.get("explanation", ""),
-                error=result_text if has_error else None
-            )
-            
-            final_response = format_response(final_result)
-            
-            # Final update with formatted response
+        # Use streaming analysis. One history list is reused and the last
+        # assistant message mutated in place, so Gradio diffs a single node
+        # instead of serializing a fresh list per update
+        streamed_history = current_history + [{"role": "assistant", "content": ""}]
+
+        # The blocking token stream runs in a worker thread and feeds an
+        # asyncio queue; this coroutine drains it at most every 50 ms and
+        # yields one aggregated update, so LLM tokens/sec is decoupled from
+        # UI yields/sec and the event loop stays free between flushes
+        chunk_queue: asyncio.Queue = asyncio.Queue()
+        loop = asyncio.get_running_loop()
+
+        def produce():
+            try:
+                for update in analyzer.analyze_stream(question):
+                    loop.call_soon_threadsafe(chunk_queue.put_nowait, update)
+            except Exception as e:
+                loop.call_soon_threadsafe(chunk_queue.put_nowait, e)
+            finally:
+                loop.call_soon_threadsafe(chunk_queue.put_nowait, _STREAM_DONE)
+
+        producer = asyncio.ensure_future(asyncio.to_thread(produce))
+
+        final_result: AnalysisResult | None = None
+        done = False
+        while not done:
+            parts = [await chunk_queue.get()]
+            # Drain everything that accumulated since the last flush
+            while True:
+                try:
+                    parts.append(chunk_queue.get_nowait())
+                except asyncio.QueueEmpty:
+                    break
+
+            for part in parts:
+                if part is _STREAM_DONE:
+                    done = True
+                elif isinstance(part, Exception):
+                    raise part
+                elif part["type"] == "result":
+                    final_result = AnalysisResult(
+                        **{k: v for k, v in part.items() if k != "type"}
+                    )
+                else:
+                    assistant_response += part["text"]
+
+            streamed_history[-1]["content"] = assistant_response
+            yield streamed_history, None, ""
+
+            if not done:
+                await asyncio.sleep(0.05)
+
+        await producer
+
+        # The terminal stream update carries the structured result, so no
+        # re-reading of analyzer.history and no second LLM call
+        if final_result is not None:
             final_history = current_history + [
-                {"role": "assistant", "content": final_response}
+                {"role": "assistant", "content": format_response(final_result)}
             ]
-            yield final_history, figure_path, ""
+            yield final_history, final_result.figure_path, ""
         else:
-            # No history saved, just use the streaming response
-            yield current_history, None, ""
+            # No terminal result (stream aborted): keep the streamed text
+            yield streamed_history, None, ""
 
     except Exception as e:
         error_msg = f"分析失败: {str(e)}"
@@ -159,50 +261,131 @@ def analyze(
         yield final_history, None, ""
 
 
-def save_history(history: list) -> gr.update:
-    """Auto-save conversation history with timestamp."""
+# Each session's history file and how many messages it already holds,
+# so each save appends only the new messages instead of rewriting the
+# file (keyed like _analyzers so concurrent sessions don't interleave)
+_session_files: dict[str, Path] = {}
+_saved_counts: dict[str, int] = {}
+
+
+def _reset_session_file(session: str):
+    """Start a fresh history file for the session's next conversation."""
+    _session_files.pop(session, None)
+    _saved_counts.pop(session, None)
+
+
+def save_history(history: list, request: gr.Request = None) -> gr.update:
+    """Auto-save conversation history by appending new messages as JSONL."""
     if not history:
         return gr.update(choices=get_history_files())
 
-    save_name = datetime.now().strftime("%Y%m%d_%H%M%S") + ".json"
-    file_path = HISTORY_DIR / save_name
-
+    session = _session_key(request)
     try:
-        with open(file_path, "w", encoding="utf-8") as f:
-            json.dump({
-                "timestamp": datetime.now().isoformat(),
-                "history": history
-            }, f, ensure_ascii=False, indent=2)
-        return gr.update(choices=get_history_files(), value=save_name.replace(".json", ""))
-    except Exception as e:
+        session_file = _session_files.get(session)
+        if session_file is None:
+            base = datetime.now().strftime("%Y%m%d_%H%M%S")
+            session_file = _ensure_history_dir() / f"{base}.jsonl"
+            # Two sessions saving within the same second must not share a file
+            suffix = 1
+            while session_file.exists():
+                session_file = HISTORY_DIR / f"{base}_{suffix}.jsonl"
+                suffix += 1
+            _session_files[session] = session_file
+            _saved_counts[session] = 0
+
+        saved_count = _saved_counts[session]
+        with open(session_file, "ab") as f:
+            if saved_count == 0:
+                f.write(_dumps_line({
+                    "type": "session_metadata",
+                    "timestamp": datetime.now().isoformat(),
+                }))
+            for record in history[saved_count:]:
+                f.write(_dumps_line(record))
+
+        _saved_counts[session] = len(history)
+        _invalidate_history_files_cache()
+        return gr.update(choices=get_history_files(), value=session_file.stem)
+    except Exception:
         return gr.update(choices=get_history_files())
 
 
+# Cached directory listing, refreshed only when HISTORY_DIR's mtime changes
+_history_files_cache = {"mtime": -1.0, "files": []}
+
+
+def _invalidate_history_files_cache():
+    _history_files_cache["mtime"] = -1.0
+
+
 def get_history_files() -> list:
-    """Get list of saved history files."""
-    files = list(HISTORY_DIR.glob("*.json"))
-    files.sort(key=lambda x: x.stat().st_mtime, reverse=True)
-    return [f.stem for f in files]
+    """Get list of saved history files (cached until the directory changes)."""
+    try:
+        dir_mtime = HISTORY_DIR.stat().st_mtime
+    except OSError:
+        return []
+
+    if dir_mtime != _history_files_cache["mtime"]:
+        # scandir's DirEntry.stat() is served from the directory read, so
+        # the refresh costs one getdents instead of one stat per file
+        with os.scandir(HISTORY_DIR) as it:
+            entries = [
+                (entry.stat().st_mtime, entry.name)
+                for entry in it
+                if entry.name.endswith((".json", ".jsonl"))
+            ]
+        entries.sort(reverse=True)
+        _history_files_cache["files"] = [name.rsplit(".", 1)[0] for _, name in entries]
+        _history_files_cache["mtime"] = dir_mtime
+
+    return _history_files_cache["files"]
+
 
+def _history_file_path(filename: str) -> Path | None:
+    """Resolve a saved history name to its file, preferring JSONL."""
+    for suffix in (".jsonl", ".json"):
+        file_path = HISTORY_DIR / f"{filename}{suffix}"
+        if file_path.exists():
+            return file_path
+    return None
 
-def load_history(filename: str) -> list:
-    """Load conversation history from a JSON file."""
-    global analyzer
+
+def load_history(filename: str, request: gr.Request = None) -> list:
+    """Load conversation history from a JSONL (or legacy JSON) file."""
+    analyzer = _get_analyzer(request)
 
     if not filename:
         return []
 
-    file_path = HISTORY_DIR / f"{filename}.json"
+    file_path = _history_file_path(filename)
+    if file_path is None:
+        return []
 
     try:
-        with open(file_path, "r", encoding="utf-8") as f:
-            data = json.load(f)
-
-        history = data.get("history", [])
+        history = []
+        if file_path.suffix == ".jsonl":
+            with open(file_path, "r", encoding="utf-8") as f:
+                for line in f:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    record = _loads(line)
+                    if record.get("type") == "session_metadata":
+                        continue
+                    history.append(record)
+        else:
+            # Legacy monolithic JSON format
+            with open(file_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            history = data.get("history", [])
 
         if analyzer:
             analyzer.new_conversation()
 
+        # The loaded conversation continues in a fresh file; otherwise the
+        # next auto-save would append it to the previous session's file
+        _reset_session_file(_session_key(request))
+
         return history
     except Exception:
         return []
@@ -213,22 +396,26 @@ def delete_history(filename: str) -> gr.update:
     if not filename:
         return gr.update()
 
-    file_path = HISTORY_DIR / f"{filename}.json"
+    file_path = _history_file_path(filename)
+    if file_path is None:
+        return gr.update()
 
     try:
         file_path.unlink()
+        _invalidate_history_files_cache()
         return gr.update(choices=get_history_files(), value=None)
     except Exception:
         return gr.update()
 
 
-def new_conversation(history: list) -> tuple[list, None, str, gr.update]:
+def new_conversation(history: list, request: gr.Request = None) -> tuple[list, None, str, gr.update]:
     """Start a new conversation, auto-save current history if exists."""
-    global analyzer
+    analyzer = _get_analyzer(request)
 
     # Auto-save current conversation before starting new one
     if history:
-        save_history(history)
+        save_history(history, request)
+    _reset_session_file(_session_key(request))
 
     if analyzer:
         analyzer.new_conversation()
@@ -237,9 +424,9 @@ def new_conversation(history: list) -> tuple[list, None, str, gr.update]:
     return [], None, "", gr.update(choices=get_history_files(), value=None)
 
 
-def set_test_mode(enabled: bool, fail_count: int) -> str:
+def set_test_mode(enabled: bool, fail_count: int, request: gr.Request = None) -> str:
     """Enable or disable test mode for error correction demonstration."""
-    global analyzer
+    analyzer = _get_analyzer(request)
 
     if analyzer is None:
         return "请先上传 CSV"
@@ -377,6 +564,11 @@ def create_app():
                         container=False
                     )
                     submit_btn = gr.Button("发送", variant="primary", scale=1, min_width=80)
+                batch_checkbox = gr.Checkbox(
+                    label="批量模式",
+                    value=False,
+                    info="每行视为一个独立问题，一次提交批量分析"
+                )
 
         # ========== Event Handlers ==========
         file_input.change(
@@ -406,13 +598,13 @@ def create_app():
 
         submit_btn.click(
             fn=analyze,
-            inputs=[question_input, chatbot, model_dropdown],
+            inputs=[question_input, chatbot, model_dropdown, batch_checkbox],
             outputs=[chatbot, image_output, question_input]
         )
 
         question_input.submit(
             fn=analyze,
-            inputs=[question_input, chatbot, model_dropdown],
+            inputs=[question_input, chatbot, model_dropdown, batch_checkbox],
             outputs=[chatbot, image_output, question_input]
         )
 
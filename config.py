@@ -4,8 +4,10 @@ import os
 from pathlib import Path
 from dotenv import load_dotenv
 
-# Load environment variables from .env file
-load_dotenv()
+# Load environment variables from .env file. Workers and tests that don't
+# need it can skip the filesystem probe via CSVDA_SKIP_DOTENV
+if not os.getenv("CSVDA_SKIP_DOTENV"):
+    load_dotenv()
 
 
 class Config:
@@ -24,16 +26,54 @@ class Config:
     # DeepSeek API base URL
     DEEPSEEK_BASE_URL: str = "https://api.deepseek.com"
 
+    # Smaller/cheaper model per provider, used for simple questions
+    SMALL_MODELS: dict = {
+        "qwen": "qwen-turbo",
+        "openai": "gpt-4o-mini",
+        "deepseek": "deepseek-chat",
+    }
+
+    # Router heuristics: short questions containing one of these keywords
+    # are considered simple enough for the small model
+    SIMPLE_QUESTION_MAX_CHARS: int = 40
+    SIMPLE_QUESTION_KEYWORDS: tuple = (
+        "head", "tail", "describe", "columns", "count",
+        "前", "行数", "列名", "预览", "多少",
+    )
+
     # Execution settings
     MAX_RETRIES: int = 3
 
+    # Run generated code in a persistent worker subprocess (opt-in):
+    # isolates crashes and matplotlib state at the cost of IPC overhead
+    EXEC_IN_SUBPROCESS: bool = os.getenv("CSVDA_EXEC_SUBPROCESS", "") == "1"
+
+    # Size of the shared LLM dispatch pool: bounds concurrent in-flight
+    # chat calls across sessions (see llm.batcher.LLMBatcher)
+    LLM_MAX_BATCH: int = 8
+
+    # Number of speculative parallel LLM completions per generation
+    # (first to finish wins). chat() exposes no sampling params here, so
+    # >1 issues identical requests and pays their full token cost for a
+    # latency race — keep that an explicit opt-in
+    SPECULATIVE_N: int = int(os.getenv("CSVDA_SPECULATIVE_N", "1"))
+
+    # Maximum number of past turns included in the LLM context
+    MAX_HISTORY_TURNS: int = 4
+
+    # Maximum characters of a past execution result kept in history
+    HISTORY_RESULT_CHARS: int = 1024
+
     # Output directory for figures
     OUTPUT_DIR: Path = Path("outputs")
 
     @classmethod
     def ensure_output_dir(cls) -> Path:
         """Ensure output directory exists and return its path."""
-        cls.OUTPUT_DIR.mkdir(exist_ok=True)
+        # Called once per analysis; the exists() check is cheaper than an
+        # unconditional mkdir syscall
+        if not cls.OUTPUT_DIR.exists():
+            cls.OUTPUT_DIR.mkdir(exist_ok=True)
         return cls.OUTPUT_DIR
 
     @classmethod
@@ -3,6 +3,7 @@
 import re
 from enum import Enum
 from dataclasses import dataclass
+from functools import lru_cache
 
 
 class ErrorType(Enum):
@@ -18,7 +19,14 @@ class ErrorType(Enum):
     RUNTIME_ERROR = "runtime"
 
 
-@dataclass
+# Attach a dense index to each member so hint lookup is a tuple indexing
+# rather than a dict hash (values stay strings for display/serialization)
+for _index, _member in enumerate(ErrorType):
+    _member.index = _index
+del _index, _member
+
+
+@dataclass(slots=True)
 class ErrorInfo:
     """Structured error information."""
     error_type: ErrorType
@@ -83,21 +91,55 @@ ERROR_HINTS = {
 }
 
 
+# Hints stripped once at import and laid out as a tuple indexed by the
+# member index, so get_hint is an array load instead of a dict lookup
+_HINTS = tuple(ERROR_HINTS[etype].strip() for etype in ErrorType)
+
+
+@lru_cache(maxsize=128)
+def _hint_for(error_type: ErrorType, missing_key: str | None, undefined_name: str | None) -> str:
+    """Build (and memoize) the hint text for one classified error shape."""
+    hint = _HINTS[error_type.index]
+    if missing_key is not None:
+        hint += f"\n注意: 找不到的列名是 '{missing_key}'"
+    elif undefined_name is not None:
+        hint += f"\n注意: 未定义的变量是 '{undefined_name}'"
+    return hint
+
+
+# One alternation covering classification and detail extraction, so a
+# single scan of the error message replaces the per-type search loop plus
+# the follow-up detail search. The detail groups are nested inside their
+# type's alternative and read from the same match
+_CLASSIFY = re.compile(
+    r"(?P<SYNTAX>SyntaxError)"
+    r"|(?P<NAME>NameError(?:.*?name\s+['\"](?P<name>\w+)['\"])?)"
+    r"|(?P<TYPE>TypeError(?:.*?cannot\s+(?P<op>\w+)\s+['\"]?(?P<typ>\w+)['\"]?)?)"
+    r"|(?P<KEY>KeyError(?::\s*['\"]?(?P<key>[^'\"]+)['\"]?)?)"
+    r"|(?P<INDEX>IndexError)"
+    r"|(?P<IMPORT>ImportError|ModuleNotFoundError)"
+    r"|(?P<VALUE>ValueError)"
+    r"|(?P<ATTR>AttributeError(?:.*?has no attribute\s+['\"](?P<attr>\w+)['\"])?)",
+    re.DOTALL,
+)
+
+# Match.lastgroup is whichever group matched last, which for a hit with
+# details is the nested group — so both levels map to the error type
+_GROUP_TYPES = {
+    "SYNTAX": ErrorType.SYNTAX_ERROR,
+    "NAME": ErrorType.NAME_ERROR, "name": ErrorType.NAME_ERROR,
+    "TYPE": ErrorType.TYPE_ERROR, "op": ErrorType.TYPE_ERROR, "typ": ErrorType.TYPE_ERROR,
+    "KEY": ErrorType.KEY_ERROR, "key": ErrorType.KEY_ERROR,
+    "INDEX": ErrorType.INDEX_ERROR,
+    "IMPORT": ErrorType.IMPORT_ERROR,
+    "VALUE": ErrorType.VALUE_ERROR,
+    "ATTR": ErrorType.ATTRIBUTE_ERROR, "attr": ErrorType.ATTRIBUTE_ERROR,
+}
+
+
 class ErrorClassifier:
     """Classify and analyze code execution errors."""
 
-    # Patterns for error classification
-    _PATTERNS = [
-        (r"SyntaxError", ErrorType.SYNTAX_ERROR),
-        (r"NameError", ErrorType.NAME_ERROR),
-        (r"TypeError", ErrorType.TYPE_ERROR),
-        (r"KeyError", ErrorType.KEY_ERROR),
-        (r"IndexError", ErrorType.INDEX_ERROR),
-        (r"ImportError|ModuleNotFoundError", ErrorType.IMPORT_ERROR),
-        (r"ValueError", ErrorType.VALUE_ERROR),
-        (r"AttributeError", ErrorType.ATTRIBUTE_ERROR),
-    ]
-
     @classmethod
     def classify(cls, error_msg: str) -> ErrorInfo:
         """
@@ -112,37 +154,23 @@ class ErrorClassifier:
         error_type = ErrorType.RUNTIME_ERROR
         details = {}
 
-        # Determine error type
-        for pattern, etype in cls._PATTERNS:
-            if re.search(pattern, error_msg):
-                error_type = etype
-                break
-
-        # Extract additional details based on error type
-        if error_type == ErrorType.KEY_ERROR:
-            # Extract the missing key/column name
-            match = re.search(r"KeyError:\s*['\"]?([^'\"]+)['\"]?", error_msg)
-            if match:
-                details["missing_key"] = match.group(1)
-
-        elif error_type == ErrorType.NAME_ERROR:
-            # Extract the undefined name
-            match = re.search(r"name\s+['\"](\w+)['\"]", error_msg)
-            if match:
-                details["undefined_name"] = match.group(1)
-
-        elif error_type == ErrorType.ATTRIBUTE_ERROR:
-            # Extract the missing attribute
-            match = re.search(r"has no attribute\s+['\"](\w+)['\"]", error_msg)
-            if match:
-                details["missing_attribute"] = match.group(1)
-
-        elif error_type == ErrorType.TYPE_ERROR:
-            # Extract type information
-            match = re.search(r"cannot\s+(\w+)\s+['\"]?(\w+)['\"]?", error_msg)
-            if match:
-                details["operation"] = match.group(1)
-                details["type"] = match.group(2)
+        match = _CLASSIFY.search(error_msg)
+        if match:
+            error_type = _GROUP_TYPES[match.lastgroup]
+
+            if error_type == ErrorType.KEY_ERROR:
+                if match.group("key"):
+                    details["missing_key"] = match.group("key")
+            elif error_type == ErrorType.NAME_ERROR:
+                if match.group("name"):
+                    details["undefined_name"] = match.group("name")
+            elif error_type == ErrorType.ATTRIBUTE_ERROR:
+                if match.group("attr"):
+                    details["missing_attribute"] = match.group("attr")
+            elif error_type == ErrorType.TYPE_ERROR:
+                if match.group("op"):
+                    details["operation"] = match.group("op")
+                    details["type"] = match.group("typ")
 
         return ErrorInfo(
             error_type=error_type,
@@ -161,22 +189,79 @@ class ErrorClassifier:
         Returns:
             A helpful hint string.
         """
-        base_hint = ERROR_HINTS.get(error_info.error_type, ERROR_HINTS[ErrorType.RUNTIME_ERROR])
+        details = error_info.details
+        missing_key = details.get("missing_key") if error_info.error_type == ErrorType.KEY_ERROR else None
+        undefined_name = details.get("undefined_name") if error_info.error_type == ErrorType.NAME_ERROR else None
+        return _hint_for(error_info.error_type, missing_key, undefined_name)
+
+
+# Prebuilt correction-context templates; one str.format call replaces the
+# per-call list building and join
+_CONTEXT_WITHOUT_HISTORY = """## 代码执行出错
+
+### 错误信息
+```
+{error_msg}
+```
+
+### 错误分析
+- 错误类型: {error_type}
+{hint}
+
+### 出错的代码
+```python
+{code}
+```
 
-        # Add specific details if available
-        if error_info.error_type == ErrorType.KEY_ERROR and "missing_key" in error_info.details:
-            base_hint += f"\n注意: 找不到的列名是 '{error_info.details['missing_key']}'"
+### CSV 数据信息
+- 可用列名: {columns}
+- 数据类型:
+{dtypes}
 
-        elif error_info.error_type == ErrorType.NAME_ERROR and "undefined_name" in error_info.details:
-            base_hint += f"\n注意: 未定义的变量是 '{error_info.details['undefined_name']}'"
+### 修复要求
+1. 仔细分析上述错误原因
+2. 参考可用列名，确保列名正确
+3. 输出完整的修正后代码（用 ```python 和 ``` 包裹）"""
 
-        return base_hint.strip()
+_CONTEXT_WITH_HISTORY = """## 代码执行出错
+
+### 错误信息
+```
+{error_msg}
+```
+
+### 错误分析
+- 错误类型: {error_type}
+{hint}
+
+### 出错的代码
+```python
+{code}
+```
+
+### CSV 数据信息
+- 可用列名: {columns}
+- 数据类型:
+{dtypes}
+
+### 最近对话历史
+{conversation_history}
+
+### 修复要求
+1. 仔细分析上述错误原因
+2. 参考可用列名，确保列名正确
+3. 输出完整的修正后代码（用 ```python 和 ``` 包裹）"""
+
+
+# Single-slot cache for the last formatted context: retry loops often
+# re-request the context for an identical error
+_last_context: tuple[int, str] | None = None
 
 
 def format_error_context(
     error_msg: str,
     code: str,
-    columns: list[str],
+    columns: list[str] | str,
     dtypes: str,
     conversation_history: str = ""
 ) -> str:
@@ -186,44 +271,33 @@ def format_error_context(
     Args:
         error_msg: The error message.
         code: The code that caused the error.
-        columns: Available CSV column names.
+        columns: Available CSV column names (list, or an already joined string).
         dtypes: DataFrame dtypes as string.
         conversation_history: Recent conversation history.
 
     Returns:
         Formatted error context string.
     """
+    global _last_context
+
+    columns_str = columns if isinstance(columns, str) else ", ".join(columns)
+    key = hash((error_msg, code, columns_str, dtypes, conversation_history))
+    if _last_context is not None and _last_context[0] == key:
+        return _last_context[1]
+
     # Classify the error
     error_info = ErrorClassifier.classify(error_msg)
     hint = ErrorClassifier.get_hint(error_info)
 
-    context_parts = [
-        "## 代码执行出错\n",
-        "### 错误信息",
-        f"```\n{error_msg}\n```\n",
-        "### 错误分析",
-        f"- 错误类型: {error_info.error_type.value.upper()}",
-        hint,
-        "",
-        "### 出错的代码",
-        f"```python\n{code}\n```\n",
-        "### CSV 数据信息",
-        f"- 可用列名: {', '.join(columns)}",
-        f"- 数据类型:\n{dtypes}\n",
-    ]
-
-    if conversation_history:
-        context_parts.extend([
-            "### 最近对话历史",
-            conversation_history,
-            ""
-        ])
-
-    context_parts.extend([
-        "### 修复要求",
-        "1. 仔细分析上述错误原因",
-        "2. 参考可用列名，确保列名正确",
-        "3. 输出完整的修正后代码（用 ```python 和 ``` 包裹）",
-    ])
-
-    return "\n".join(context_parts)
+    template = _CONTEXT_WITH_HISTORY if conversation_history else _CONTEXT_WITHOUT_HISTORY
+    context = template.format(
+        error_msg=error_msg,
+        error_type=error_info.error_type.value.upper(),
+        hint=hint,
+        code=code,
+        columns=columns_str,
+        dtypes=dtypes,
+        conversation_history=conversation_history,
+    )
+    _last_context = (key, context)
+    return context
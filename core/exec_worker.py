@@ -0,0 +1,95 @@
+"""Persistent subprocess worker for isolated execution of generated code."""
+
+import multiprocessing
+import threading
+
+from core.executor import ExecutionResult
+
+# One worker per CSV path, shared by all executors in the process
+_workers: dict[str, "SubprocessWorker"] = {}
+_workers_lock = threading.Lock()
+
+
+def _worker_main(conn, csv_path: str):
+    """Worker-process loop: execute code strings received over the pipe."""
+    import matplotlib
+    matplotlib.use('Agg')
+
+    from config import Config
+    from core.executor import CodeExecutor
+
+    # The flag is inherited from the parent; clear it so the worker's own
+    # executor runs in-process instead of recursing into another worker
+    Config.EXEC_IN_SUBPROCESS = False
+
+    executor = CodeExecutor(csv_path)
+    while True:
+        try:
+            code = conn.recv()
+        except (EOFError, OSError):
+            break
+        if code is None:
+            break
+        result = executor.execute(code)
+        conn.send((result.success, result.output, result.error, result.figure_path))
+
+
+class SubprocessWorker:
+    """Client handle for one persistent execution worker."""
+
+    def __init__(self, csv_path: str):
+        # forkserver forks workers from a clean server process without
+        # re-importing __main__ (spawn would re-run the Gradio app)
+        try:
+            ctx = multiprocessing.get_context('forkserver')
+        except ValueError:
+            ctx = multiprocessing.get_context('spawn')
+        self._conn, child_conn = ctx.Pipe()
+        self._proc = ctx.Process(
+            target=_worker_main, args=(child_conn, csv_path), daemon=True
+        )
+        self._proc.start()
+        child_conn.close()
+        self._lock = threading.Lock()
+
+    def is_alive(self) -> bool:
+        return self._proc.is_alive()
+
+    def execute(self, code: str, timeout: float = 120.0) -> ExecutionResult:
+        """Run code in the worker, enforcing a per-query time limit."""
+        with self._lock:
+            self._conn.send(code)
+            if not self._conn.poll(timeout):
+                # Worker is stuck; kill it so the next call gets a fresh one
+                self.close()
+                return ExecutionResult(
+                    success=False,
+                    output="",
+                    error="TimeoutError: 代码执行超时",
+                    figure_path=None,
+                )
+            success, output, error, figure_path = self._conn.recv()
+        return ExecutionResult(
+            success=success, output=output, error=error, figure_path=figure_path
+        )
+
+    def close(self):
+        """Shut the worker down."""
+        try:
+            self._conn.send(None)
+        except OSError:
+            pass
+        self._proc.join(timeout=1.0)
+        if self._proc.is_alive():
+            self._proc.terminate()
+        self._conn.close()
+
+
+def get_worker(csv_path: str) -> SubprocessWorker:
+    """Get (or start) the persistent worker for this CSV."""
+    with _workers_lock:
+        worker = _workers.get(csv_path)
+        if worker is None or not worker.is_alive():
+            worker = SubprocessWorker(csv_path)
+            _workers[csv_path] = worker
+        return worker
@@ -1,19 +1,158 @@
 """Code executor for running generated Python code."""
 
+import ast
 import io
-import re
+import os
+import queue
 import sys
-import uuid
-from contextlib import redirect_stdout, redirect_stderr
+import threading
+import types
 from dataclasses import dataclass
+from functools import lru_cache
 from pathlib import Path
+from typing import Generator
 
 import matplotlib
 matplotlib.use('Agg')  # Use non-interactive backend
 import matplotlib.pyplot as plt
+from matplotlib.figure import Figure
 import pandas as pd
 
 from config import Config
+from core.fast_convert import clean_money, parse_percent
+
+_font_cache_warmed = False
+
+
+def _warm_font_cache():
+    """
+    Build matplotlib's font cache in the background.
+
+    A cold process pays 100-500ms of font lookup on its first draw; doing
+    it on a daemon thread while the user types their first question hides
+    that latency. Uses a bare Figure so pyplot's global state (which the
+    executor manages) is never touched.
+    """
+    global _font_cache_warmed
+    if _font_cache_warmed:
+        return
+    _font_cache_warmed = True
+
+    def warm():
+        fig = Figure()
+        ax = fig.add_subplot()
+        ax.plot([0], [0])
+        ax.set_title("warmup")
+        fig.canvas.draw()
+
+    threading.Thread(target=warm, daemon=True).start()
+
+
+class _LineQueueWriter(io.StringIO):
+    """StringIO that also pushes completed output lines onto a queue."""
+
+    def __init__(self, line_queue: queue.Queue):
+        super().__init__()
+        self._line_queue = line_queue
+        self._pending = ""
+
+    def write(self, s: str) -> int:
+        written = super().write(s)
+        self._pending += s
+        while "\n" in self._pending:
+            line, self._pending = self._pending.split("\n", 1)
+            self._line_queue.put(line + "\n")
+        return written
+
+
+# Plotting calls on plt that warrant a figure save
+_PLOT_FUNCS = frozenset(
+    {"show", "figure", "plot", "bar", "scatter", "hist", "pie", "boxplot"}
+)
+
+
+def _save_stmts() -> list[ast.stmt]:
+    """Statements that save the current figure and flip the saved flag."""
+    # The target path is read from __fig_path__ at run time, so the
+    # compiled code object is independent of any particular filename
+    src = (
+        "plt.savefig(__fig_path__, dpi=100, bbox_inches='tight')\n"
+        "__figure_saved__ = True"
+    )
+    return ast.parse(src).body
+
+
+class _ShowToSave(ast.NodeTransformer):
+    """Replace plt.show() statements with a savefig + flag pair."""
+
+    def __init__(self):
+        self.replaced = False
+
+    def visit_Expr(self, node: ast.Expr):
+        call = node.value
+        if (
+            isinstance(call, ast.Call)
+            and isinstance(call.func, ast.Attribute)
+            and call.func.attr == "show"
+            and isinstance(call.func.value, ast.Name)
+            and call.func.value.id == "plt"
+        ):
+            self.replaced = True
+            return _save_stmts()
+        return self.generic_visit(node)
+
+
+def _has_plot_call(tree: ast.AST) -> bool:
+    """Whether the tree contains any plotting call (plt.* or sns.*)."""
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute):
+            owner = node.func.value
+            if isinstance(owner, ast.Name) and (
+                owner.id == "sns"
+                or (owner.id == "plt" and node.func.attr in _PLOT_FUNCS)
+            ):
+                return True
+    return False
+
+
+def _extract_source(text: str) -> str:
+    """Extract Python code from markdown code blocks."""
+    # Fast path: plain-code responses have no fences at all
+    if "```" not in text:
+        return text.strip()
+
+    # Linear scan for code fences; prefer ```python over bare ```
+    start = text.find("```python")
+    if start != -1:
+        start += len("```python")
+    else:
+        start = text.find("```") + 3
+
+    end = text.find("```", start)
+    if end == -1:
+        return text[start:].strip()
+    return text[start:end].strip()
+
+
+@lru_cache(maxsize=128)
+def _compile(raw_text: str) -> types.CodeType:
+    """
+    Extract, rewrite and compile a raw LLM response in one cached step.
+
+    The AST transform replaces plt.show() statements with savefig (immune
+    to occurrences in comments or string literals, unlike the old string
+    replacement) and appends a save when code plots without showing. The
+    save targets the __fig_path__ variable supplied per run, so the cached
+    code object is filename-independent: a retry or replay of the same
+    response skips extraction, parsing and compilation entirely.
+    """
+    tree = ast.parse(_extract_source(raw_text), mode="exec")
+    transformer = _ShowToSave()
+    tree = transformer.visit(tree)
+    if not transformer.replaced and _has_plot_call(tree):
+        tree.body.extend(_save_stmts())
+    ast.fix_missing_locations(tree)
+    return compile(tree, "<llm_exec>", "exec", dont_inherit=True)
 
 
 @dataclass
@@ -37,12 +176,26 @@ class CodeExecutor:
 
     def __init__(self, csv_path: str):
         self.csv_path = csv_path
+        self._df: pd.DataFrame | None = None
+        # Figures are drawn to a stable per-executor scratch name (no uuid
+        # generation per run), then renamed to a sequence-numbered file on
+        # success so cached results and history entries keep pointing at
+        # the chart that produced them
+        self._fig_stem = f"figure_{os.getpid()}_{id(self):x}"
+        self._fig_name = f"{self._fig_stem}.png"
+        self._fig_seq = 0
         self.globals: dict = {}
         self._init_globals()
+        # Reusable capture buffers: truncated between runs instead of
+        # allocating two fresh StringIOs per execute
+        self._stdout_buf = io.StringIO()
+        self._stderr_buf = io.StringIO()
         # Test mode settings
         self._test_mode = False
         self._fail_count = 0
         self._max_fails = 0
+        # Overlaps the one-time font-cache build with user think time
+        _warm_font_cache()
 
     def set_test_mode(self, enabled: bool, fail_count: int = 1):
         """
@@ -55,6 +208,28 @@ class CodeExecutor:
         self._test_mode = enabled
         self._max_fails = fail_count if enabled else 0
         self._fail_count = 0
+        if enabled:
+            # Shadow execute with the injecting variant on this instance,
+            # so the production method carries no test-mode branch
+            self.execute = self._execute_with_injection
+        else:
+            # Drop the shadow to restore the class-bound method
+            self.__dict__.pop("execute", None)
+
+    def _execute_with_injection(
+        self, code: str, _line_queue: queue.Queue | None = None
+    ) -> ExecutionResult:
+        """execute() variant bound while test mode is active."""
+        if self._fail_count < self._max_fails:
+            self._fail_count += 1
+            error_msg = self._TEST_ERRORS[(self._fail_count - 1) % len(self._TEST_ERRORS)]
+            return ExecutionResult(
+                success=False,
+                output="",
+                error=f"[测试模式] {error_msg}",
+                figure_path=None
+            )
+        return type(self).execute(self, code, _line_queue=_line_queue)
 
     def _init_globals(self):
         """Initialize the global namespace with common imports."""
@@ -62,86 +237,163 @@ class CodeExecutor:
             "pd": pd,
             "plt": plt,
             "csv_path": self.csv_path,
+            "df": self._df,
+            "clean_money": clean_money,
+            "parse_percent": parse_percent,
             "__builtins__": __builtins__,
         }
 
+    def set_dataframe(self, df: pd.DataFrame):
+        """Attach the preloaded DataFrame exposed to generated code as df."""
+        self._df = df
+        self.globals["df"] = df
+
+    def _load_dataframe(self) -> pd.DataFrame | None:
+        """Load the CSV once for standalone use (the analyzer normally injects it)."""
+        try:
+            # Arrow's multi-threaded C++ parser is several times faster than
+            # the default C engine on wide/large files
+            return pd.read_csv(self.csv_path, engine='pyarrow')
+        except OSError:
+            # Missing/unreadable file: leave df unset, code can still run
+            return None
+        except (ImportError, TypeError, ValueError):
+            try:
+                return pd.read_csv(self.csv_path)
+            except Exception:
+                return None
+
     def _extract_code(self, text: str) -> str:
         """Extract Python code from markdown code blocks."""
-        # Try to find code in ```python ... ``` blocks
-        pattern = r"```python\s*(.*?)\s*```"
-        matches = re.findall(pattern, text, re.DOTALL)
-        if matches:
-            return matches[0].strip()
-
-        # Try to find code in ``` ... ``` blocks
-        pattern = r"```\s*(.*?)\s*```"
-        matches = re.findall(pattern, text, re.DOTALL)
-        if matches:
-            return matches[0].strip()
-
-        # Return original text if no code blocks found
-        return text.strip()
+        return _extract_source(text)
 
-    def _inject_figure_save(self, code: str, figure_path: Path) -> str:
-        """Inject figure saving code and remove plt.show() calls."""
-        save_code = f"plt.savefig(r'{figure_path}', dpi=100, bbox_inches='tight')"
+    def precompile(self, code: str):
+        """
+        Warm the compile cache for code that is about to be executed.
 
-        if "plt.show()" in code:
-            # Replace plt.show() with save only (remove show to avoid warning)
-            code = code.replace("plt.show()", save_code)
-        elif "plt.figure(" in code or "plt.plot(" in code or "plt.bar(" in code:
-            # If there's plotting but no show(), add save at the end
-            code = f"{code}\n{save_code}"
+        Safe to call from a background thread while the rest of the LLM
+        response is still streaming; compile errors are left for execute()
+        to report.
+        """
+        try:
+            _compile(code)
+        except SyntaxError:
+            pass
 
-        return code
+    def execute_stream(self, code: str) -> Generator[str, None, ExecutionResult]:
+        """
+        Execute code, yielding stdout lines as they are produced.
 
-    def execute(self, code: str) -> ExecutionResult:
+        Runs the code in a worker thread so long-running analyses show
+        partial output instead of blocking until completion.
+
+        Args:
+            code: Python code to execute (may be wrapped in markdown code blocks).
+
+        Returns:
+            The final ExecutionResult, as the generator's return value.
+        """
+        line_queue: queue.Queue = queue.Queue()
+        result_holder: dict = {}
+
+        def run():
+            try:
+                result_holder["result"] = self.execute(code, _line_queue=line_queue)
+            except BaseException as e:
+                # Surface worker failures to the caller instead of dying
+                # silently and leaving the result slot empty
+                result_holder["error"] = e
+            finally:
+                line_queue.put(None)
+
+        worker = threading.Thread(target=run, daemon=True)
+        worker.start()
+
+        while True:
+            line = line_queue.get()
+            if line is None:
+                break
+            yield line
+
+        worker.join()
+        if "error" in result_holder:
+            raise result_holder["error"]
+        return result_holder["result"]
+
+    def execute(self, code: str, _line_queue: queue.Queue | None = None) -> ExecutionResult:
         """
         Execute code and capture output and figures.
 
         Args:
             code: Python code to execute (may be wrapped in markdown code blocks).
+            _line_queue: Internal; receives completed stdout lines during execution.
 
         Returns:
             ExecutionResult with success status, output, error, and figure path.
         """
-        # Test mode: inject errors
-        if self._test_mode and self._fail_count < self._max_fails:
-            self._fail_count += 1
-            error_msg = self._TEST_ERRORS[(self._fail_count - 1) % len(self._TEST_ERRORS)]
-            return ExecutionResult(
-                success=False,
-                output="",
-                error=f"[测试模式] {error_msg}",
-                figure_path=None
-            )
+        # Optional isolation: hand the run to the persistent worker process
+        # (the streaming path stays in-process for line-by-line output)
+        if Config.EXEC_IN_SUBPROCESS and _line_queue is None:
+            return self._execute_in_worker(code)
 
-        # Extract code from markdown if needed
-        code = self._extract_code(code)
-
-        # Prepare figure path
+        # Prepare figure path; the injected save code reads it from
+        # __fig_path__, keeping the compiled object reusable across paths
         Config.ensure_output_dir()
-        figure_path = Config.OUTPUT_DIR / f"figure_{uuid.uuid4().hex[:8]}.png"
-
-        # Inject figure saving
-        code = self._inject_figure_save(code, figure_path)
-
-        # Capture stdout and stderr
-        stdout_capture = io.StringIO()
-        stderr_capture = io.StringIO()
+        figure_path = Config.OUTPUT_DIR / self._fig_name
+
+        # Capture stdout and stderr; the streaming path needs its own
+        # queue-bound writer, the plain path reuses the preallocated pair
+        if _line_queue is not None:
+            stdout_capture = _LineQueueWriter(_line_queue)
+        else:
+            stdout_capture = self._stdout_buf
+            stdout_capture.seek(0)
+            stdout_capture.truncate()
+        stderr_capture = self._stderr_buf
+        stderr_capture.seek(0)
+        stderr_capture.truncate()
+
+        # Hand generated code a shallow copy of the cached frame: O(#columns)
+        # instead of reparsing the CSV, and mutations don't leak between runs
+        if self._df is None:
+            self._df = self._load_dataframe()
+        if self._df is not None:
+            self.globals["df"] = self._df.copy(deep=False)
+
+        # Close any existing figures (skip the teardown walk entirely when
+        # nothing is open, which is the common non-plotting case)
+        if plt.get_fignums():
+            plt.close('all')
 
-        # Close any existing figures
-        plt.close('all')
+        # Reset the save flag (the injected save code flips it to True)
+        # and point the injected savefig at this run's path
+        self.globals["__figure_saved__"] = False
+        self.globals["__fig_path__"] = str(figure_path)
 
         try:
-            with redirect_stdout(stdout_capture), redirect_stderr(stderr_capture):
-                exec(code, self.globals)
+            # Swap the streams directly: cheaper than the redirect_stdout/
+            # redirect_stderr context managers and restored in the finally
+            old_stdout, old_stderr = sys.stdout, sys.stderr
+            sys.stdout, sys.stderr = stdout_capture, stderr_capture
+            try:
+                exec(_compile(code), self.globals)
+            finally:
+                sys.stdout, sys.stderr = old_stdout, old_stderr
 
             output = stdout_capture.getvalue()
             stderr_output = stderr_capture.getvalue()
 
-            # Check if figure was generated
-            actual_figure_path = str(figure_path) if figure_path.exists() else None
+            # Check if figure was generated (in-namespace flag, no stat
+            # call), then move it to a unique per-run name so a later plot
+            # can't overwrite a figure an earlier result still references
+            actual_figure_path = None
+            if self.globals.get("__figure_saved__"):
+                self._fig_seq += 1
+                final_path = (
+                    Config.OUTPUT_DIR / f"{self._fig_stem}_{self._fig_seq}.png"
+                )
+                os.replace(figure_path, final_path)
+                actual_figure_path = str(final_path)
 
             return ExecutionResult(
                 success=True,
@@ -158,7 +410,21 @@ class CodeExecutor:
                 figure_path=None,
             )
         finally:
-            plt.close('all')
+            if plt.get_fignums():
+                plt.close('all')
+
+    def _execute_in_worker(self, code: str) -> ExecutionResult:
+        """Delegate execution to the shared persistent subprocess worker."""
+        from core.exec_worker import get_worker
+        try:
+            return get_worker(self.csv_path).execute(code)
+        except Exception as e:
+            return ExecutionResult(
+                success=False,
+                output="",
+                error=f"WorkerError: {str(e)}",
+                figure_path=None,
+            )
 
     def reset(self):
         """Reset the execution environment."""
@@ -0,0 +1,32 @@
+"""Prebuilt numeric-cleanup helpers exposed to generated code.
+
+Generated cleanup snippets vary between runs and occasionally fall back to
+per-row regex; these helpers give the LLM a fixed, vectorized target that
+always takes the C-level string paths. Both accept a Series, array or list
+and return a float64 Series with unparseable cells as NaN.
+"""
+
+import pandas as pd
+
+
+def _as_str_series(values) -> pd.Series:
+    series = values if isinstance(values, pd.Series) else pd.Series(values)
+    return series.astype("str")
+
+
+def clean_money(values) -> pd.Series:
+    """把 "$1,234" / "¥1,234" 之类的金额文本转换为 float64。"""
+    cleaned = (
+        _as_str_series(values)
+        .str.replace("$", "", regex=False)
+        .str.replace("¥", "", regex=False)
+        .str.replace(",", "", regex=False)
+        .str.strip()
+    )
+    return pd.to_numeric(cleaned, errors="coerce")
+
+
+def parse_percent(values) -> pd.Series:
+    """把 "75%" 之类的百分比文本转换为 float64（"75%" -> 75.0）。"""
+    cleaned = _as_str_series(values).str.strip().str.removesuffix("%")
+    return pd.to_numeric(cleaned, errors="coerce")
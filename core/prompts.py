@@ -1,5 +1,7 @@
 """Prompt templates for the CSV analyzer."""
 
+from functools import lru_cache
+
 SYSTEM_PROMPT_TEMPLATE = """你是一个专业的数据分析助手。用户提供数据分析问题，你生成 Python 代码解决。
 
 ## CSV 文件信息
@@ -11,8 +13,9 @@ SYSTEM_PROMPT_TEMPLATE = """你是一个专业的数据分析助手。用户提
 {sample_data}
 
 ## 数据格式说明
-- 如果 Sales 列格式为 "$1,234"，需转换: df['Sales'].str.replace('[$,]', '', regex=True).astype(float)
-- 如果 Rating 列格式为 "75%"，需转换: df['Rating'].str.rstrip('%').astype(float)
+- 如果 Sales 列格式为 "$1,234"，需转换: df['Sales'].str.replace('$', '', regex=False).str.replace(',', '', regex=False).astype('float64')
+- 如果 Rating 列格式为 "75%"，需转换: df['Rating'].str.removesuffix('%').astype('float64')
+- 优先使用内置的向量化转换函数: clean_money(df['Sales']) 处理金额列，parse_percent(df['Rating']) 处理百分比列
 - 请根据实际数据格式进行适当的类型转换
 
 ## 代码要求
@@ -23,32 +26,43 @@ SYSTEM_PROMPT_TEMPLATE = """你是一个专业的数据分析助手。用户提
 5. 如需绑图，使用 plt.figure() 创建图表，并调用 plt.show()
 6. 图表标题和标签请使用英文，避免中文显示问题
 7. 代码要完整，可以独立运行
-8. CSV 文件路径已定义为变量 csv_path = "{csv_path}"
-"""
-
-ERROR_CORRECTION_PROMPT = """代码执行出错:
-{error}
-
-{code_section}
-
-{history_section}
-
-请修正代码，只输出完整的修正后代码（用 ```python 和 ``` 包裹）。
-注意：请仔细分析错误原因，确保修正后的代码能够正确运行。
+8. DataFrame 已预加载为变量 df，直接使用即可，无需重新读取；如确需重读，CSV 路径为变量 csv_path = "{csv_path}"
+9. 代码块之后另起一行，以 "解释:" 开头给出 2-3 句中文分析说明，用 {{result}} 占位执行结果
 """
 
 # Enhanced error correction prompt with more context
 ENHANCED_ERROR_CORRECTION_PROMPT = """{error_context}
 """
 
-EXPLANATION_PROMPT = """基于以下代码执行结果，用中文给出简洁的数据分析解释（2-3句话）:
+# Several questions answered in one completion: shared prefill (system
+# prompt + CSV schema), enumerated questions, per-question sections
+BATCH_QUESTIONS_PROMPT = """以下是 {count} 个数据分析问题，请一次性依次回答：
+
+{questions}
 
-用户问题: {question}
-执行结果:
-{result}
+## 输出要求
+1. 按编号依次回答，每个问题之前单独一行写 "### 问题 N"（N 为问题编号）
+2. 每个问题的代码单独用 ```python 和 ``` 包裹，且完整、可独立运行
+3. 每个代码块之后另起一行，以 "解释:" 开头给出中文分析说明，用 {{result}} 占位执行结果
 """
 
 
+@lru_cache(maxsize=16)
+def _render_system_prompt(
+    csv_path: str,
+    columns: tuple,
+    dtypes: str,
+    sample_data: str,
+) -> str:
+    """Render the system prompt once per CSV; a session reuses the string."""
+    return SYSTEM_PROMPT_TEMPLATE.format(
+        csv_path=csv_path,
+        columns=", ".join(columns),
+        dtypes=dtypes,
+        sample_data=sample_data,
+    )
+
+
 class PromptBuilder:
     """Builder for constructing prompts."""
 
@@ -60,12 +74,7 @@ class PromptBuilder:
         sample_data: str,
     ) -> str:
         """Build the system prompt with CSV information."""
-        return SYSTEM_PROMPT_TEMPLATE.format(
-            csv_path=csv_path,
-            columns=", ".join(columns),
-            dtypes=dtypes,
-            sample_data=sample_data,
-        )
+        return _render_system_prompt(csv_path, tuple(columns), dtypes, sample_data)
 
     @staticmethod
     def build_error_correction_prompt(
@@ -74,21 +83,28 @@ class PromptBuilder:
         conversation_history: str = ""
     ) -> str:
         """Build the error correction prompt."""
-        code_section = ""
-        if code:
-            code_section = f"出错的代码:\n```python\n{code}\n```\n"
-        
-        history_section = ""
-        if conversation_history:
-            history_section = f"最近的对话历史:\n{conversation_history}\n"
-        
-        return ERROR_CORRECTION_PROMPT.format(
-            error=error,
-            code_section=code_section,
-            history_section=history_section
+        # Single f-string render: the optional sections are built in place
+        # instead of being formatted empty and re-formatted into a template
+        code_section = f"出错的代码:\n```python\n{code}\n```\n" if code else ""
+        history_section = (
+            f"最近的对话历史:\n{conversation_history}\n" if conversation_history else ""
+        )
+        return (
+            f"代码执行出错:\n{error}\n\n{code_section}\n\n{history_section}\n\n"
+            "请修正代码，只输出完整的修正后代码（用 ```python 和 ``` 包裹）。\n"
+            "注意：请仔细分析错误原因，确保修正后的代码能够正确运行。\n"
         )
 
     @staticmethod
     def build_explanation_prompt(question: str, result: str) -> str:
         """Build the explanation prompt."""
-        return EXPLANATION_PROMPT.format(question=question, result=result)
+        return (
+            "基于以下代码执行结果，用中文给出简洁的数据分析解释（2-3句话）:\n\n"
+            f"用户问题: {question}\n执行结果:\n{result}\n"
+        )
+
+    @staticmethod
+    def build_batch_questions_prompt(questions: list[str]) -> str:
+        """Build a prompt that answers several questions in one completion."""
+        numbered = "\n".join(f"{i}. {q}" for i, q in enumerate(questions, 1))
+        return BATCH_QUESTIONS_PROMPT.format(count=len(questions), questions=numbered)
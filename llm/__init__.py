@@ -1,8 +1,24 @@
 """LLM providers package."""
 
-from .base import BaseLLM
-from .qwen import QwenLLM
-from .openai_llm import OpenAILLM
-from .deepseek import DeepSeekLLM
+import importlib
 
-__all__ = ["BaseLLM", "QwenLLM", "OpenAILLM", "DeepSeekLLM"]
+# Providers are imported lazily so app startup doesn't pay for every
+# vendor SDK (openai, dashscope, ...) when only one model is used
+_EXPORTS = {
+    "BaseLLM": ".base",
+    "LLMBatcher": ".batcher",
+    "QwenLLM": ".qwen",
+    "OpenAILLM": ".openai_llm",
+    "DeepSeekLLM": ".deepseek",
+}
+
+__all__ = list(_EXPORTS)
+
+
+def __getattr__(name: str):
+    """Import the requested provider class on first access."""
+    try:
+        module = importlib.import_module(_EXPORTS[name], __name__)
+    except KeyError:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}") from None
+    return getattr(module, name)
@@ -0,0 +1,36 @@
+"""Shared HTTP transport for OpenAI-compatible providers."""
+
+import httpx
+
+# Process-wide HTTP client shared by all providers, so retries and
+# follow-up calls reuse one keep-alive connection (HTTP/2 when the h2
+# extra is installed) instead of paying a fresh TCP+TLS handshake
+_shared_http_client: httpx.Client | None = None
+_shared_async_http_client: httpx.AsyncClient | None = None
+
+
+def get_http_client() -> httpx.Client:
+    """Get the shared keep-alive HTTP client, creating it on first use."""
+    global _shared_http_client
+    if _shared_http_client is None:
+        limits = httpx.Limits(max_keepalive_connections=16, max_connections=32)
+        try:
+            _shared_http_client = httpx.Client(http2=True, timeout=60.0, limits=limits)
+        except ImportError:
+            # http2 extra (h2) not installed; keep-alive still applies
+            _shared_http_client = httpx.Client(timeout=60.0, limits=limits)
+    return _shared_http_client
+
+
+def get_async_http_client() -> httpx.AsyncClient:
+    """Get the shared async HTTP client, creating it on first use."""
+    global _shared_async_http_client
+    if _shared_async_http_client is None:
+        limits = httpx.Limits(max_keepalive_connections=16, max_connections=32)
+        try:
+            _shared_async_http_client = httpx.AsyncClient(
+                http2=True, timeout=60.0, limits=limits
+            )
+        except ImportError:
+            _shared_async_http_client = httpx.AsyncClient(timeout=60.0, limits=limits)
+    return _shared_async_http_client
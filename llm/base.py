@@ -1,5 +1,6 @@
 """Abstract base class for LLM providers."""
 
+import asyncio
 from abc import ABC, abstractmethod
 from typing import Generator
 
@@ -32,3 +33,18 @@ class BaseLLM(ABC):
             Chunks of the response text.
         """
         pass
+
+    async def chat_async(self, messages: list[dict]) -> str:
+        """
+        Async variant of chat, usable for concurrent fan-out.
+
+        Providers with a native async SDK override this; the default runs
+        the blocking chat() in a worker thread.
+
+        Args:
+            messages: List of message dicts with 'role' and 'content' keys.
+
+        Returns:
+            The assistant's response text.
+        """
+        return await asyncio.to_thread(self.chat, messages)
@@ -0,0 +1,38 @@
+"""Shared dispatch pool for LLM chat calls."""
+
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from config import Config
+
+from .base import BaseLLM
+
+
+class LLMBatcher:
+    """Dispatch chat requests on one shared, bounded worker pool.
+
+    The providers used here expose no true batch endpoint, so requests are
+    dispatched immediately — holding them back would only add latency. The
+    shared pool bounds concurrent in-flight calls across sessions (and
+    keeps them on the shared keep-alive connections).
+    """
+
+    def __init__(self, max_batch: int | None = None):
+        self.max_batch = max_batch or Config.LLM_MAX_BATCH
+        self._pool = ThreadPoolExecutor(max_workers=self.max_batch)
+
+    def submit(self, llm: BaseLLM, messages: list[dict]) -> Future:
+        """Dispatch a chat call and return a Future resolving to the response."""
+        future: Future = Future()
+        self._pool.submit(self._run_one, llm, messages, future)
+        return future
+
+    def chat(self, llm: BaseLLM, messages: list[dict]) -> str:
+        """Blocking convenience wrapper around submit()."""
+        return self.submit(llm, messages).result()
+
+    @staticmethod
+    def _run_one(llm: BaseLLM, messages: list[dict], future: Future):
+        try:
+            future.set_result(llm.chat(messages))
+        except Exception as e:
+            future.set_exception(e)
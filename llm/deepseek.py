@@ -2,21 +2,46 @@
 
 from typing import Generator
 
-from openai import OpenAI
+from openai import AsyncOpenAI, OpenAI
 
 from config import Config
 from .base import BaseLLM
+from ._http import get_async_http_client, get_http_client
 
 
 class DeepSeekLLM(BaseLLM):
     """DeepSeek LLM provider (uses OpenAI-compatible API)."""
 
-    def __init__(self):
+    def __init__(self, model: str | None = None):
+        # Retries/backoff are handled by the analyzer; the SDK's own retry
+        # layer would just stack extra latency on top
         self.client = OpenAI(
             api_key=Config.DEEPSEEK_API_KEY,
             base_url=Config.DEEPSEEK_BASE_URL,
+            http_client=get_http_client(),
+            max_retries=0,
         )
-        self.model = Config.DEEPSEEK_MODEL
+        self.model = model or Config.DEEPSEEK_MODEL
+        self._async_client: AsyncOpenAI | None = None
+
+    def _get_async_client(self) -> AsyncOpenAI:
+        """Create the async client lazily, only when chat_async is used."""
+        if self._async_client is None:
+            self._async_client = AsyncOpenAI(
+                api_key=Config.DEEPSEEK_API_KEY,
+                base_url=Config.DEEPSEEK_BASE_URL,
+                http_client=get_async_http_client(),
+                max_retries=0,
+            )
+        return self._async_client
+
+    async def chat_async(self, messages: list[dict]) -> str:
+        """Send messages to DeepSeek without blocking the event loop."""
+        response = await self._get_async_client().chat.completions.create(
+            model=self.model,
+            messages=messages,
+        )
+        return response.choices[0].message.content or ""
 
     def chat(self, messages: list[dict]) -> str:
         """Send messages to DeepSeek and get a response."""
@@ -34,6 +59,12 @@ class DeepSeekLLM(BaseLLM):
             stream=True,
         )
 
+        # Hot loop: one attribute walk per chunk, and skip keep-alive
+        # chunks that carry no choices
         for chunk in stream:
-            if chunk.choices[0].delta.content:
-                yield chunk.choices[0].delta.content
+            choices = chunk.choices
+            if not choices:
+                continue
+            content = choices[0].delta.content
+            if content:
+                yield content
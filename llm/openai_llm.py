@@ -2,18 +2,44 @@
 
 from typing import Generator
 
-from openai import OpenAI
+from openai import AsyncOpenAI, OpenAI
 
 from config import Config
 from .base import BaseLLM
+from ._http import get_async_http_client, get_http_client
 
 
 class OpenAILLM(BaseLLM):
     """OpenAI LLM provider."""
 
-    def __init__(self):
-        self.client = OpenAI(api_key=Config.OPENAI_API_KEY)
-        self.model = Config.OPENAI_MODEL
+    def __init__(self, model: str | None = None):
+        # Retries/backoff are handled by the analyzer; the SDK's own retry
+        # layer would just stack extra latency on top
+        self.client = OpenAI(
+            api_key=Config.OPENAI_API_KEY,
+            http_client=get_http_client(),
+            max_retries=0,
+        )
+        self.model = model or Config.OPENAI_MODEL
+        self._async_client: AsyncOpenAI | None = None
+
+    def _get_async_client(self) -> AsyncOpenAI:
+        """Create the async client lazily, only when chat_async is used."""
+        if self._async_client is None:
+            self._async_client = AsyncOpenAI(
+                api_key=Config.OPENAI_API_KEY,
+                http_client=get_async_http_client(),
+                max_retries=0,
+            )
+        return self._async_client
+
+    async def chat_async(self, messages: list[dict]) -> str:
+        """Send messages to OpenAI without blocking the event loop."""
+        response = await self._get_async_client().chat.completions.create(
+            model=self.model,
+            messages=messages,
+        )
+        return response.choices[0].message.content or ""
 
     def chat(self, messages: list[dict]) -> str:
         """Send messages to OpenAI and get a response."""
@@ -31,6 +57,12 @@ class OpenAILLM(BaseLLM):
             stream=True,
         )
 
+        # Hot loop: one attribute walk per chunk, and skip keep-alive
+        # chunks that carry no choices
         for chunk in stream:
-            if chunk.choices[0].delta.content:
-                yield chunk.choices[0].delta.content
+            choices = chunk.choices
+            if not choices:
+                continue
+            content = choices[0].delta.content
+            if content:
+                yield content
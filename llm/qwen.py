@@ -1,5 +1,6 @@
 """Qwen (通义千问) LLM implementation using DashScope."""
 
+import operator
 from typing import Generator
 
 import dashscope
@@ -8,13 +9,17 @@ from dashscope import Generation
 from config import Config
 from .base import BaseLLM
 
+# Pre-bound attribute path for the streaming hot loop: one C-level call
+# per chunk instead of re-resolving output.choices each time
+_get_choices = operator.attrgetter("output.choices")
+
 
 class QwenLLM(BaseLLM):
     """Qwen LLM provider using DashScope API."""
 
-    def __init__(self):
+    def __init__(self, model: str | None = None):
         dashscope.api_key = Config.DASHSCOPE_API_KEY
-        self.model = Config.QWEN_MODEL
+        self.model = model or Config.QWEN_MODEL
 
     def chat(self, messages: list[dict]) -> str:
         """Send messages to Qwen and get a response."""
@@ -41,12 +46,13 @@ class QwenLLM(BaseLLM):
             incremental_output=True,
         )
 
+        # Error status arrives once and terminates the stream, so the loop
+        # body is just the early-out check plus the yield
         for response in responses:
-            if response.status_code == 200:
-                content = response.output.choices[0].message.content
-                if content:
-                    yield content
-            else:
+            if response.status_code != 200:
                 raise Exception(
                     f"Qwen API error: {response.code} - {response.message}"
                 )
+            content = _get_choices(response)[0].message.content
+            if content:
+                yield content
@@ -31,7 +31,7 @@ class ErrorInjectingExecutor(CodeExecutor):
         self._fail_count = fail_count
         self._current_fails = 0
 
-    def execute(self, code: str) -> ExecutionResult:
+    def execute(self, code: str, _line_queue=None) -> ExecutionResult:
         """Execute code with optional error injection."""
         if self._current_fails < self._fail_count:
             self._current_fails += 1
@@ -53,7 +53,7 @@ class ErrorInjectingExecutor(CodeExecutor):
 
         # Normal execution
         print(f"\n[TEST] Normal execution (after {self._current_fails} injected failures)")
-        return super().execute(code)
+        return super().execute(code, _line_queue=_line_queue)
 
 
 def test_error_correction(csv_path: str, fail_count: int = 1):
@@ -79,7 +79,12 @@ def test_error_correction(csv_path: str, fail_count: int = 1):
 
     # Run analysis with streaming to see the correction process
     for update in analyzer.analyze_stream(question):
-        print(update, end="")
+        if update["type"] == "token":
+            print(update["text"], end="")
+        else:
+            print("\n[TEST] Final result:")
+            print(f"  success: {update['error'] is None}")
+            print(f"  figure:  {update['figure_path']}")
 
     print("\n" + "=" * 60)
     print("Test completed!")